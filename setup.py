@@ -9,9 +9,13 @@ setup(
         "pandas",
         "chromadb",
         "langchain-openai",
+        "tenacity",
+        "orjson",
         "python-dotenv",
         "tqdm",
         "sentence-transformers",
-        "openpyxl"
+        "openpyxl",
+        "xlsxwriter",
+        "lxml"
     ],
 )
\ No newline at end of file
@@ -18,7 +18,7 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import functions from existing files
-from src.parseXMLs import parse_ccda_file, register_namespaces, extract_key_clinical_info
+from src.parseXMLs import parse_ccda_file, extract_key_clinical_info
 from src.createCorpusDB import process_json_file
 from src.createVectorDB import create_corpus_db
 from src.findTrialsByChroma import match_and_rank_trials, print_patient_summary
@@ -60,15 +60,14 @@ def process_single_patient(
     patient_output_dir = os.path.join(output_dir, patient_name)
     os.makedirs(patient_output_dir, exist_ok=True)
 
-    logger.info(f"Processing patient: {patient_name}")
+    logger.info("Processing patient: %s", patient_name)
 
     # Step 3: Parse patient CCDA file
     logger.info("Step 3: Parsing patient CCDA file")
-    register_namespaces()
     patient_data = parse_ccda_file(patient_file_path)
 
     if not patient_data:
-        logger.error(f"Failed to parse the patient file: {patient_file_path}")
+        logger.error("Failed to parse the patient file: %s", patient_file_path)
         return None
 
     # Generate key clinical information if not already present
@@ -104,7 +103,7 @@ def process_single_patient(
         trials_json_path=matched_trials_json,
         model_name=model_name,
         top_k=top_k,
-        temperature=0.1,
+        temperature=0.0,
         current_date=datetime.now().strftime("%Y-%m-%d")
     )
 
@@ -112,7 +111,7 @@ def process_single_patient(
     with open(eligibility_output, 'w') as f:
         json.dump(eligibility_results, f, indent=2)
 
-    logger.info(f"Eligibility evaluation complete. Results saved to {eligibility_output}")
+    logger.info("Eligibility evaluation complete. Results saved to %s", eligibility_output)
 
     # Step 6: Generate output files
     logger.info("Step 6: Generating formatted output files")
@@ -123,9 +122,9 @@ def process_single_patient(
         output_dir=formatted_output_dir
     )
 
-    logger.info(f"Output generation complete.")
-    logger.info(f"JSON output: {output_results.get('json_path', 'None')}")
-    logger.info(f"Excel output: {output_results.get('excel_path', 'None')}")
+    logger.info("Output generation complete.")
+    logger.info("JSON output: %s", output_results.get('json_path', 'None'))
+    logger.info("Excel output: %s", output_results.get('excel_path', 'None'))
 
     # Return results for this patient
     return {
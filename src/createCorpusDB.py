@@ -305,14 +305,28 @@ def create_database(db_path: str):
     ''')
 
     # Create indexes for faster queries
+    create_indexes(conn)
+
+    conn.commit()
+    conn.close()
+
+def create_indexes(conn: sqlite3.Connection):
+    """
+    Create the indexes used by the demographic filter and the per-trial lookups.
+    Safe to run on an existing database, since every index is created only if missing.
+
+    Args:
+        conn: Open connection to the clinical trials database
+    """
+    cursor = conn.cursor()
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_trial_id ON trials (trial_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_min_age ON trials (minimum_age)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_max_age ON trials (maximum_age)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_sex ON trials (sex)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sex_age ON trials (sex, minimum_age, maximum_age)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_conditions ON conditions (condition_name)')
-
-    conn.commit()
-    conn.close()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conditions_trial ON conditions (trial_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_interventions_trial ON interventions (trial_id)')
 
 def insert_trial_data(db_path: str, parsed_data: Dict[str, Any]):
     """
@@ -463,6 +477,11 @@ def process_json_file(json_file_path: str, db_path: str, sample_size: int = 1000
                     print(f"Error processing trial: {e}")
                     processed_trials = 0
 
+            # Refresh planner statistics so the indexes are used
+            conn = sqlite3.connect(db_path)
+            conn.execute('ANALYZE')
+            conn.close()
+
             return total_trials, processed_trials
     except Exception as e:
         print(f"Error reading JSON file: {e}")
@@ -4,8 +4,30 @@ from chromadb.utils import embedding_functions
 from sentence_transformers import SentenceTransformer
 import argparse
 import os
+import numpy as np
 from tqdm import tqdm
 
+# Trial embedding matrix and matching trial IDs saved alongside the ChromaDB index
+TRIAL_EMBEDDINGS_FILE = "trial_embeddings.npy"
+TRIAL_IDS_FILE = "trial_ids.npy"
+
+def save_trial_embeddings(collection, chroma_path):
+    """
+    Save every trial embedding in the collection as a float16 matrix, so trials can be
+    scored with a single matrix product without querying ChromaDB
+
+    Args:
+        collection: ChromaDB collection holding the trial embeddings
+        chroma_path: Path where the ChromaDB is stored
+    """
+    result = collection.get(include=["embeddings"])
+    trial_ids = np.asarray(result["ids"])
+    trial_embeddings = np.asarray(result["embeddings"], dtype=np.float16)
+
+    np.save(os.path.join(chroma_path, TRIAL_EMBEDDINGS_FILE), trial_embeddings)
+    np.save(os.path.join(chroma_path, TRIAL_IDS_FILE), trial_ids)
+    print(f"Saved {len(trial_ids)} trial embeddings to {chroma_path}")
+
 def create_corpus_db(sqlite_path, chroma_path, batch_size=100):
     """
     Extract data from clinical trials SQLite DB and add to ChromaDB
@@ -157,6 +179,8 @@ def create_corpus_db(sqlite_path, chroma_path, batch_size=100):
             print(f"Added {len(documents)} trials to ChromaDB (batch {i//batch_size + 1})")
 
     print(f"Completed! Added {collection.count()} trials to ChromaDB.")
+
+    save_trial_embeddings(collection, chroma_path)
     conn.close()
 
 def main():
@@ -1,23 +1,61 @@
+import argparse
+import glob
 import json
 import os
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Any, Optional
+import httpx
+import openai
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception_type, wait_random_exponential, stop_after_attempt
 import sys
 
 # Import from the enhanced parser module to parse CCDA files
 sys.path.append('../')  # Add parent directory to path to import custom modules
-from src.parseXMLs import parse_ccda_file, register_namespaces, extract_key_clinical_info
+from src.parseXMLs import parse_ccda_file, extract_key_clinical_info
+
+# Shared HTTP connection pool for all LLM requests
+_http_client = None
+
+def _get_http_client() -> httpx.Client:
+    """Return a process-wide HTTP client so connections are reused across trials and patients"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=64)
+        )
+    return _http_client
+
+# Output tokens budgeted per criterion: one JSON object with a short rationale and
+# the patient's medication list
+TOKENS_PER_CRITERION = 200
+
+@retry(
+    retry=retry_if_exception_type((
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    )),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+def _invoke_llm(llm: ChatOpenAI, prompt: str, **kwargs):
+    """Send a prompt to the LLM, retrying rate limits, timeouts, connection errors and 5xx responses with backoff"""
+    return llm.invoke([HumanMessage(content=prompt)], **kwargs)
 
 def evaluate_patient_eligibility(
     patient_data: Dict[str, Any],
     trials_json_path: str,
     model_name: str = "gpt-4o-mini",
     top_k: int = 20,
-    temperature: float = 0.1,
-    current_date: Optional[str] = None
+    temperature: float = 0.0,
+    current_date: Optional[str] = None,
+    max_tokens: int = 800
 ) -> Dict[str, Any]:
     """
     Evaluates whether a patient meets the inclusion criteria for the top k trials.
@@ -29,6 +67,8 @@ def evaluate_patient_eligibility(
         top_k: Number of top trials to evaluate (default: 20)
         temperature: Temperature setting for the LLM
         current_date: Optional date string (defaults to today's date)
+        max_tokens: Minimum number of tokens the LLM may generate per trial; raised to
+            TOKENS_PER_CRITERION per criterion for trials with many criteria
 
     Returns:
         Dictionary with evaluation results for each trial
@@ -51,9 +91,16 @@ def evaluate_patient_eligibility(
     top_trials = ranked_trials[:min(top_k, len(ranked_trials))]
 
     # Initialize the LLM with API key from environment variables
+    # Retries are handled by _invoke_llm, so the client's own retry loop is disabled
     llm = ChatOpenAI(
         model=model_name,
-        temperature=temperature
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=1.0,
+        frequency_penalty=0.0,
+        presence_penalty=0.0,
+        max_retries=0,
+        http_client=_get_http_client()
     )
 
     # Extract patient clinical note from the data
@@ -107,8 +154,8 @@ The inclusion criteria being assessed are listed below, followed by their defini
 {formatted_criteria}
 
 # Assessment
-For each of the criteria above, use the patient's clinical note to determine whether the patient meets each criteria. Think step by step, and
-justify your answer.
+For each of the criteria above, use the patient's clinical note to determine whether the patient meets each criteria. Justify in ≤2 sentences per
+criterion.
 
 Format your response as a JSON list of dictionaries, where each dictionary contains the following elements:
 * criterion: str - The name of the criterion being assessed
@@ -123,7 +170,10 @@ Please provide your JSON response:
 
         # Send to the LLM
         try:
-            response = llm.invoke([HumanMessage(content=prompt)])
+            # Scale the output cap with the criterion count so long criteria lists
+            # are not cut off mid-array
+            trial_max_tokens = max(max_tokens, TOKENS_PER_CRITERION * len(inclusion_criteria))
+            response = _invoke_llm(llm, prompt, max_tokens=trial_max_tokens)
             response_text = response.content.strip()
 
             # Try to parse JSON from the response
@@ -243,42 +293,92 @@ def save_eligibility_results(results: Dict[str, Any], output_path: str) -> None:
         json.dump(results, f, indent=2)
     print(f"Results saved to {output_path}")
 
-def main():
-    """
-    Main function to evaluate patient eligibility for clinical trials using default values.
+def _load_patient_for_evaluation(path: str) -> Optional[Dict[str, Any]]:
     """
-    # Default values
-    patient_file = "../data/synthea_sample_data_ccda_latest/Ada662_Sari509_Balistreri607_dbc4a3f7-9c69-4435-3ce3-4e1988ab6b91.xml"
-    ranked_trials_json = "../data/matched_trials_results.json"
-    output_path = "../data/eligibility_results.json"
+    Parse a patient file and attach its key clinical information.
 
-    # Register namespaces for XML parsing
-    register_namespaces()
+    Runs inside a worker process, so it must stay at module level to be picklable.
 
-    # Parse the patient file
-    print(f"Parsing patient file: {patient_file}")
-    patient_data = parse_ccda_file(patient_file)
+    Args:
+        path: Path to the patient CCDA XML file
 
+    Returns:
+        Patient data dictionary with key_clinical_info, or None if parsing failed
+    """
+    patient_data = parse_ccda_file(path)
     if not patient_data:
-        print("Failed to parse the patient file.")
-        return
+        return None
 
     # Generate key clinical information if not already present
     if "key_clinical_info" not in patient_data:
-        print("Generating key clinical information...")
         patient_data["key_clinical_info"] = extract_key_clinical_info(patient_data)
+    return patient_data
 
-    # Run evaluation with default parameters
-    print(f"Evaluating patient eligibility for top 10 trials...")
-    results = evaluate_patient_eligibility(
-        patient_data=patient_data,
-        trials_json_path=ranked_trials_json,
-        top_k=10
-    )
-
-    # Save results
-    save_eligibility_results(results, output_path)
-    print(f"Evaluation complete. Results saved to {output_path}")
+def main():
+    """
+    Main function to parse command line arguments and evaluate patient eligibility for clinical trials.
+    """
+    parser = argparse.ArgumentParser(description="Evaluate patient eligibility for ranked clinical trials")
+
+    parser.add_argument("--patient", "-p", type=str, nargs="+",
+                      default=["../data/synthea_sample_data_ccda_latest/Ada662_Sari509_Balistreri607_dbc4a3f7-9c69-4435-3ce3-4e1988ab6b91.xml"],
+                      help="One or more patient CCDA XML files or directories of patient files")
+
+    parser.add_argument("--trials-json", "-j", type=str,
+                      default="../data/matched_trials_results.json",
+                      help="Path to the ranked trials JSON file (output from findTrialsByChroma)")
+
+    parser.add_argument("--output", "-o", type=str,
+                      default="../data/eligibility_results.json",
+                      help="Path to the eligibility results JSON file; with several patients, each "
+                           "patient's results go to <patient name>/<file name> beside it")
+
+    parser.add_argument("--top-k", "-k", type=int,
+                      default=10,
+                      help="Number of top trials to evaluate per patient (default: 10)")
+
+    args = parser.parse_args()
+
+    # Expand directories into the patient XML files they contain
+    patient_files = []
+    for patient_path in args.patient:
+        if os.path.isdir(patient_path):
+            patient_files.extend(sorted(glob.glob(os.path.join(patient_path, "*.xml"))))
+        else:
+            patient_files.append(patient_path)
+
+    # Parse multiple patient files in parallel; a single file is parsed in-process,
+    # where a worker pool would only add start-up and pickling cost
+    print(f"Parsing {len(patient_files)} patient file(s)...")
+    if len(patient_files) <= 1:
+        patients = [_load_patient_for_evaluation(patient_file) for patient_file in patient_files]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(patient_files), os.cpu_count() or 1)) as executor:
+            patients = list(executor.map(_load_patient_for_evaluation, patient_files))
+
+    for patient_file, patient_data in zip(patient_files, patients):
+        if not patient_data:
+            print(f"Failed to parse the patient file: {patient_file}")
+            continue
+
+        print(f"Evaluating patient eligibility for top {args.top_k} trials...")
+        results = evaluate_patient_eligibility(
+            patient_data=patient_data,
+            trials_json_path=args.trials_json,
+            top_k=args.top_k
+        )
+
+        # Save results; with several patients, each gets its own directory named after
+        # the patient file, the same layout combined_pipeline uses
+        if len(patient_files) == 1:
+            patient_output = args.output
+        else:
+            patient_name = os.path.splitext(os.path.basename(patient_file))[0]
+            patient_output_dir = os.path.join(os.path.dirname(args.output), patient_name)
+            os.makedirs(patient_output_dir, exist_ok=True)
+            patient_output = os.path.join(patient_output_dir, os.path.basename(args.output))
+        save_eligibility_results(results, patient_output)
+        print(f"Evaluation complete. Results saved to {patient_output}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,23 +1,277 @@
 import sqlite3
 import chromadb
+import numpy as np
 from chromadb.utils import embedding_functions
 import argparse
+import functools
+import glob
 import os
-import json
+import orjson
 import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # Import from the enhanced parser module
+from src.createVectorDB import TRIAL_EMBEDDINGS_FILE, TRIAL_IDS_FILE
 from src.parseXMLs import (
     parse_ccda_file,
-    register_namespaces,
     generate_semantic_search_query,
     extract_key_clinical_info
 )
 
+# Demographic match query. It is a single fixed statement with every value bound, so
+# SQLite can reuse the prepared plan; a NULL age or sex disables that filter.
+# Ordering by trial_id keeps the limited subset stable whichever plan SQLite picks.
+# Conditions and interventions are looked up separately.
+_MATCH_SQL = """
+SELECT
+    t.trial_id,
+    t.trial_title,
+    t.minimum_age,
+    t.maximum_age,
+    t.sex,
+    t.accepts_healthy_volunteers,
+    t.requires_english,
+    t.requires_internet,
+    COUNT(*) OVER () AS total_count
+FROM
+    trials t
+WHERE (? IS NULL OR t.minimum_age IS NULL OR t.minimum_age <= ?)
+  AND (? IS NULL OR t.maximum_age IS NULL OR t.maximum_age >= ?)
+  AND (? IS NULL OR t.sex = ? OR t.sex = 'ALL')
+ORDER BY t.trial_id
+LIMIT ?
+"""
+
+# Number of trial IDs bound per IN (...) lookup, kept under SQLite's variable limit
+SQLITE_MAX_PARAMS = 900
+
+# Model the clinical trials collection was indexed with
+EMBEDDING_MODEL_NAME = "BAAI/bge-large-en-v1.5"
+
+# Number of trial IDs passed per ChromaDB $in filter
+CHROMA_MAX_FILTER_IDS = 32000
+
+# Embedding backend used by the fallback ranker ("default" or "int8_onnx")
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "default")
+
+# Quantized BGE model used when EMBED_BACKEND=int8_onnx
+INT8_MODEL_NAME = "Intel/bge-small-en-v1.5-sts-int8-static-inc"
+
+# Loaded quantized embedding function, shared across calls
+_int8_embedding_function = None
+
+class QuantizedEmbeddingFunction:
+    """
+    Thin callable wrapper around an INT8 ONNX BGE model that matches the
+    embedding function interface used by ChromaDB (texts in, vectors out).
+    """
+    def __init__(self, model_name=INT8_MODEL_NAME):
+        from langchain_community.embeddings import QuantizedBgeEmbeddings
+        self.model = QuantizedBgeEmbeddings(
+            model_name=model_name,
+            encode_kwargs={"normalize_embeddings": True}
+        )
+
+    def __call__(self, texts):
+        return self.model.embed_documents(list(texts))
+
+class FastSentenceTransformerEmbeddingFunction(embedding_functions.SentenceTransformerEmbeddingFunction):
+    """
+    SentenceTransformer embedding function that runs in FP16 on a GPU when one is available
+    (CPU threading is left to configure_torch_threads). Only the models cache and the loaded _model, which
+    every supported chromadb release provides, are taken from the parent class; on
+    releases that persist embedding function config it inherits the stock name and
+    config, so existing collections open unchanged.
+    """
+    def __init__(self, model_name="BAAI/bge-large-en-v1.5", normalize_embeddings=False):
+        import torch
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        # The parent class keeps one loaded model per model name
+        is_loaded = model_name in self.models
+        super().__init__(model_name=model_name, device=device, normalize_embeddings=normalize_embeddings)
+        if device == "cuda" and not is_loaded:
+            self._model.half()
+
+        # The parent's attribute for this flag differs between chromadb releases
+        self._normalize = normalize_embeddings
+
+    def __call__(self, input):
+        import torch
+
+        with torch.inference_mode():
+            embeddings = self._model.encode(
+                list(input),
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=self._normalize,
+                show_progress_bar=False
+            )
+        return [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+
+def configure_torch_threads():
+    """
+    Use every CPU core for CPU inference with a single inter-op thread. Called from the
+    command-line entry point, since it changes torch's settings for the whole process.
+    """
+    try:
+        import torch
+    except ImportError:
+        return
+
+    torch.set_num_threads(os.cpu_count())
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # torch only accepts this before any parallel work has run in the process
+        pass
+
+def get_fallback_embedding_function(default_embedding_function):
+    """
+    Get the embedding function used for fallback similarity scoring.
+
+    The ChromaDB collection must be queried with the model it was indexed with, so the
+    quantized backend is only used for the manual fallback ranking.
+
+    Args:
+        default_embedding_function: Embedding function attached to the collection
+
+    Returns:
+        The INT8 ONNX embedding function if EMBED_BACKEND=int8_onnx and it can be loaded,
+        otherwise the default embedding function
+    """
+    global _int8_embedding_function
+
+    if EMBED_BACKEND != "int8_onnx":
+        return default_embedding_function
+
+    if _int8_embedding_function is None:
+        try:
+            _int8_embedding_function = QuantizedEmbeddingFunction()
+            print(f"Loaded INT8 ONNX embedding model {INT8_MODEL_NAME}")
+        except ImportError:
+            print("Warning: langchain-community with intel-extension-for-transformers is required for "
+                  "EMBED_BACKEND=int8_onnx, using default embedding model")
+            return default_embedding_function
+
+    return _int8_embedding_function
+
+def encode_length_sorted(embedding_function, texts):
+    """
+    Encode texts in order of length so each batch pads to a similar sequence length,
+    then restore the original order.
+
+    Args:
+        embedding_function: Callable mapping a list of texts to a list of vectors
+        texts: List of texts to encode
+
+    Returns:
+        float32 array of shape (len(texts), dim) in the original text order
+    """
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    sorted_embeddings = np.asarray(embedding_function([texts[i] for i in order]), dtype=np.float32)
+
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+def select_top_trials(trials, similarities, top_k=None):
+    """
+    Order trials by similarity, keeping only the top_k if specified
+
+    Args:
+        trials: List of trial dictionaries, aligned with similarities
+        similarities: 1-D array of similarity scores
+        top_k: Number of top results to return (None for all)
+
+    Returns:
+        List of trials, best first, each with its semantic_score set
+    """
+    # Select the top_k first if specified so only that prefix is sorted
+    if top_k is not None and 0 < top_k < len(similarities):
+        top_indices = np.argpartition(-similarities, top_k - 1)[:top_k]
+        order = top_indices[np.argsort(-similarities[top_indices])]
+    else:
+        order = np.argsort(-similarities)
+
+    ranked_trials = []
+    for i in order:
+        trial = trials[i]
+        trial['semantic_score'] = float(similarities[i])
+        ranked_trials.append(trial)
+    return ranked_trials
+
+def distance_to_cosine(distance, space="l2"):
+    """
+    Convert a ChromaDB distance to the cosine similarity reported as semantic_score,
+    so every ranking path scores trials on the same scale.
+
+    BGE embeddings are unit length, so Chroma's default squared L2 distance is
+    2 - 2 * cosine; cosine and inner product distances are 1 - similarity.
+
+    Args:
+        distance: Distance returned by a ChromaDB query
+        space: The collection's hnsw:space distance function
+
+    Returns:
+        float cosine similarity
+    """
+    if space == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+@functools.lru_cache(maxsize=4)
+def _get_embedding_function(model_name):
+    """Load the embedding model once per model name"""
+    return FastSentenceTransformerEmbeddingFunction(model_name=model_name)
+
+@functools.lru_cache(maxsize=4)
+def _load_trial_embeddings(chroma_path):
+    """
+    Load the trial embedding matrix saved next to the ChromaDB index
+
+    Args:
+        chroma_path: Path to the ChromaDB directory
+
+    Returns:
+        Tuple of (trial_ids array, memory-mapped embedding matrix)
+
+    Raises:
+        FileNotFoundError: If the index was built without saving the embeddings
+    """
+    trial_ids = np.load(os.path.join(chroma_path, TRIAL_IDS_FILE))
+    trial_embeddings = np.load(os.path.join(chroma_path, TRIAL_EMBEDDINGS_FILE), mmap_mode='r')
+    return trial_ids, trial_embeddings
+
+@functools.lru_cache(maxsize=4)
+def _get_collection(chroma_path, model_name):
+    """
+    Open the clinical trials ChromaDB collection, loading the embedding model once per path.
+
+    Args:
+        chroma_path: Path to the ChromaDB directory
+        model_name: Name of the SentenceTransformer model used to index the collection
+
+    Returns:
+        Tuple of (client, collection, embedding_function, collection_count)
+    """
+    client = chromadb.PersistentClient(path=chroma_path)
+
+    # Set up embedding function
+    embedding_function = _get_embedding_function(model_name)
+
+    collection = client.get_collection(
+        name="clinical_trials",
+        embedding_function=embedding_function
+    )
+    return client, collection, embedding_function, collection.count()
+
 def match_patient_to_trials(patient_data, db_path="../data/clinical_trials.db", limit=1000):
     """
     Match patient data against clinical trials in the database based on demographics.
-    Uses a single optimized query for performance.
+    Fetches the matching trial rows, then bulk-loads their conditions and interventions.
 
     Args:
         patient_data: Dictionary containing parsed patient data from C-CDA file
@@ -50,112 +304,71 @@ def match_patient_to_trials(patient_data, db_path="../data/clinical_trials.db",
     mapped_sex = gender_mapping.get(gender)
 
     # Connect to database
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+
+    # Matching only reads; use a 64 MB page cache to keep hot pages resident
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute("PRAGMA cache_size = -65536")
+
+    # Create custom row factory to handle the query results; column names are
+    # computed once per statement, since cursor.description is fixed until the next execute
+    description = None
+    columns = None
 
-    # Create custom row factory to handle the query results
     def dict_factory(cursor, row):
-        d = {}
-        for idx, col in enumerate(cursor.description):
-            d[col[0]] = row[idx]
-        return d
+        nonlocal description, columns
+        if cursor.description is not description:
+            description = cursor.description
+            columns = [col[0] for col in description]
+        return dict(zip(columns, row))
 
     conn.row_factory = dict_factory
     cursor = conn.cursor()
 
-    # Build the base query without limit for counting
-    base_query = """
-    SELECT
-        COUNT(DISTINCT t.trial_id) as total_count
-    FROM
-        trials t
-    WHERE 1=1
-    """
-
-    count_params = []
-
-    # Add age criteria if available
-    if age is not None:
-        base_query += " AND (t.minimum_age IS NULL OR t.minimum_age <= ?)"
-        count_params.append(age)
-        base_query += " AND (t.maximum_age IS NULL OR t.maximum_age >= ?)"
-        count_params.append(age)
-
-    # Add sex criteria if available
-    if mapped_sex:
-        base_query += " AND (t.sex = ? OR t.sex = 'ALL')"
-        count_params.append(mapped_sex)
+    # Execute the query; missing demographics are bound as NULL, which disables that filter
+    print(f"Executing optimized query...")
+    cursor.execute(_MATCH_SQL, (age, age, age, age, mapped_sex, mapped_sex, limit))
 
-    # Execute the count query
-    cursor.execute(base_query, count_params)
-    total_matches = cursor.fetchone()['total_count']
+    # Rows are already dicts; every row carries the total number of matches before the limit
+    matches = []
+    total_matches = 0
+    for trial in cursor:
+        total_matches = trial.pop('total_count')
+        matches.append(trial)
     print(f"Total matching trials (before limit): {total_matches}")
 
-    # Build a single optimized query that gets all the data we need
-    query = """
-    SELECT
-        t.trial_id,
-        t.trial_title,
-        t.minimum_age,
-        t.maximum_age,
-        t.sex,
-        t.accepts_healthy_volunteers,
-        t.requires_english,
-        t.requires_internet,
-        GROUP_CONCAT(DISTINCT c.condition_name) AS conditions,
-        GROUP_CONCAT(DISTINCT i.intervention_type || ': ' || i.intervention_name) AS interventions
-    FROM
-        trials t
-    LEFT JOIN
-        conditions c ON t.trial_id = c.trial_id
-    LEFT JOIN
-        interventions i ON t.trial_id = i.trial_id
-    WHERE 1=1
-    """
-
-    params = []
-
-    # Add age criteria if available
-    if age is not None:
-        query += " AND (t.minimum_age IS NULL OR t.minimum_age <= ?)"
-        params.append(age)
-        query += " AND (t.maximum_age IS NULL OR t.maximum_age >= ?)"
-        params.append(age)
+    # Bulk-load conditions and interventions for the matched trials
+    conditions = defaultdict(list)
+    interventions = defaultdict(list)
+    trial_ids = [trial['trial_id'] for trial in matches]
 
-    # Add sex criteria if available
-    if mapped_sex:
-        query += " AND (t.sex = ? OR t.sex = 'ALL')"
-        params.append(mapped_sex)
+    for i in range(0, len(trial_ids), SQLITE_MAX_PARAMS):
+        batch_ids = trial_ids[i:i + SQLITE_MAX_PARAMS]
+        placeholders = ','.join('?' * len(batch_ids))
 
-    # Group by trial_id to combine the GROUP_CONCAT results properly
-    query += " GROUP BY t.trial_id"
-
-    # Add limit to improve performance
-    query += f" LIMIT {limit}"
-
-    # Execute the query
-    print(f"Executing optimized query...")
-    cursor.execute(query, params)
-
-    # Process the results
-    matches = []
-    for row in cursor.fetchall():
-        trial = dict(row)
-
-        # Process concatenated fields
-        if trial.get('conditions'):
-            trial['conditions'] = trial['conditions'].split(',')
-        else:
-            trial['conditions'] = []
-
-        if trial.get('interventions'):
-            trial['interventions'] = [
-                {'intervention': intervention}
-                for intervention in trial['interventions'].split(',')
-            ]
-        else:
-            trial['interventions'] = []
+        # DISTINCT drops duplicate rows, as GROUP_CONCAT(DISTINCT ...) did in the joined query
+        cursor.execute(
+            f"SELECT DISTINCT trial_id, condition_name FROM conditions "
+            f"WHERE trial_id IN ({placeholders}) AND condition_name IS NOT NULL",
+            batch_ids
+        )
+        for row in cursor:
+            conditions[row['trial_id']].append(row['condition_name'])
+
+        # A NULL type or name makes the concatenation NULL, and those rows are skipped
+        cursor.execute(
+            f"SELECT DISTINCT trial_id, intervention_type || ': ' || intervention_name AS intervention "
+            f"FROM interventions WHERE trial_id IN ({placeholders})",
+            batch_ids
+        )
+        for row in cursor:
+            if row['intervention'] is None:
+                continue
+            interventions[row['trial_id']].append({'intervention': row['intervention']})
 
-        matches.append(trial)
+    for trial in matches:
+        trial['conditions'] = conditions.get(trial['trial_id'], [])
+        trial['interventions'] = interventions.get(trial['trial_id'], [])
 
     print(f"Retrieved {len(matches)} of {total_matches} total matching trials")
 
@@ -183,37 +396,9 @@ def rank_matched_trials(matched_trials, patient_data, chroma_path, top_k=None):
     print(f"Number of trial IDs to rank: {len(trial_ids)}")
     print(f"Example trial IDs: {trial_ids[:5] if len(trial_ids) >= 5 else trial_ids}")
 
-    # Connect to ChromaDB
-    print(f"Connecting to ChromaDB at {chroma_path}")
-    client = chromadb.PersistentClient(path=chroma_path)
-
-    # List collections (in ChromaDB v0.6.0, this returns collection names only)
-    collections = client.list_collections()
-    print(f"Available collections: {collections}")
-
-    if "clinical_trials" not in collections:
-        print("Error: 'clinical_trials' collection not found in ChromaDB")
-        return matched_trials
-
-    # Set up embedding function
-    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="BAAI/bge-large-en-v1.5"
-    )
-
-    # Get collection
-    try:
-        collection = client.get_collection(
-            name="clinical_trials",
-            embedding_function=embedding_function
-        )
-        print(f"Collection count: {collection.count()}")
-    except Exception as e:
-        print(f"Error connecting to ChromaDB collection: {e}")
-        return matched_trials
-
-    # Use the enhanced semantic search query generator
-    if "key_clinical_info" in patient_data and "semantic_search_query" in patient_data["key_clinical_info"]:
-        query = patient_data["key_clinical_info"]["semantic_search_query"]
+    # Use the query from key clinical info, only generating one if it is missing
+    query = patient_data.get("key_clinical_info", {}).get("semantic_search_query")
+    if query:
         print(f"Using pre-generated semantic search query from patient data")
     else:
         query = generate_semantic_search_query(patient_data)
@@ -221,58 +406,93 @@ def rank_matched_trials(matched_trials, patient_data, chroma_path, top_k=None):
 
     print(f"Semantic search query: '{query}'")
 
-    # Try to fetch some results using ChromaDB v0.6.0 API
+    # Score directly against the saved trial embeddings when the index build stored them
     try:
-        print("Using ChromaDB v0.6.0 compatible query...")
+        stored_ids, stored_embeddings = _load_trial_embeddings(chroma_path)
+    except FileNotFoundError:
+        stored_ids, stored_embeddings = None, None
+
+    if stored_ids is not None:
+        mask = np.isin(stored_ids, trial_ids)
+        if mask.any():
+            print(f"Scoring {mask.sum()} trials against saved trial embeddings")
+            embedding_function = _get_embedding_function(EMBEDDING_MODEL_NAME)
+            query_embedding = np.asarray(embedding_function([query])[0], dtype=np.float32)
+            query_embedding /= np.linalg.norm(query_embedding) + 1e-12
+
+            candidate_embeddings = np.asarray(stored_embeddings[mask], dtype=np.float32)
+            candidate_embeddings /= np.linalg.norm(candidate_embeddings, axis=1, keepdims=True) + 1e-12
+            similarities = candidate_embeddings @ query_embedding
+
+            trial_dict = {trial['trial_id']: trial for trial in matched_trials}
+            candidates = [trial_dict[trial_id] for trial_id in stored_ids[mask]]
+            ranked_trials = select_top_trials(candidates, similarities, top_k)
+
+            print(f"Ranked {len(candidates)} trials using saved trial embeddings")
+            if top_k is not None and top_k > 0:
+                print(f"Returning top {top_k} results")
+            return ranked_trials
 
-        # In v0.6.0, we use where_document.ids instead of ids parameter
-        results = collection.query(
-            query_texts=[query],
-            where={"$id": {"$in": trial_ids}},
-            n_results=min(len(trial_ids), collection.count())
+    # Connect to ChromaDB (client, model, and collection are reused across calls)
+    print(f"Connecting to ChromaDB at {chroma_path}")
+    try:
+        client, collection, embedding_function, collection_count = _get_collection(
+            chroma_path, EMBEDDING_MODEL_NAME
         )
+        print(f"Collection count: {collection_count}")
+    except Exception as e:
+        print(f"Error connecting to ChromaDB collection: {e}")
+        return matched_trials
 
-        if results and results['ids'] and results['ids'][0]:
-            print(f"Query returned {len(results['ids'][0])} results")
-        else:
-            print("Query returned no results, trying without filters...")
-
-            # Try without filtering
-            results = collection.query(
+    # Restrict the nearest-neighbour search to the demographically matched trials, ranking
+    # all of them unless top_k is given
+    n_results = min(len(trial_ids), top_k or len(trial_ids), collection_count)
+    try:
+        print("Querying ChromaDB with a trial_id metadata filter...")
+        hits = []
+        for i in range(0, len(trial_ids), CHROMA_MAX_FILTER_IDS):
+            batch_results = collection.query(
                 query_texts=[query],
-                n_results=min(100, collection.count())
+                where={"trial_id": {"$in": trial_ids[i:i + CHROMA_MAX_FILTER_IDS]}},
+                n_results=n_results,
+                include=["distances"]
             )
+            hits.extend(zip(batch_results['ids'][0], batch_results['distances'][0]))
 
-            if results and results['ids'] and results['ids'][0]:
-                print(f"Unfiltered query returned {len(results['ids'][0])} results")
-                # Filter results manually
-                filtered_ids = []
-                filtered_distances = []
-
-                for i, doc_id in enumerate(results['ids'][0]):
-                    if doc_id in trial_ids:
-                        filtered_ids.append(doc_id)
-                        filtered_distances.append(results['distances'][0][i])
-
-                results = {
-                    'ids': [filtered_ids],
-                    'distances': [filtered_distances]
-                }
-                print(f"After filtering: {len(filtered_ids)} matches")
-            else:
-                print("Unfiltered query also returned no results")
+        # Merge the per-batch neighbours into a single nearest-first list
+        hits.sort(key=lambda hit: hit[1])
+        hits = hits[:n_results]
+        results = {
+            'ids': [[doc_id for doc_id, _ in hits]],
+            'distances': [[distance for _, distance in hits]]
+        }
+        print(f"Query returned {len(hits)} results")
 
     except Exception as e:
         print(f"Error during ChromaDB query: {e}")
-        # Try a different syntax
+        # Older collections may not store trial_id metadata, so fetch the matched trials'
+        # stored embeddings by document ID and score them here
         try:
-            print("Trying alternative query syntax...")
-            results = collection.query(
-                query_texts=[query],
-                n_results=min(100, collection.count())
-            )
+            print("Fetching stored embeddings by document IDs...")
+            stored = collection.get(ids=trial_ids, include=["embeddings"])
+            if len(stored['ids']):
+                query_embedding = np.asarray(embedding_function([query])[0], dtype=np.float32)
+                query_embedding /= np.linalg.norm(query_embedding) + 1e-12
+                candidate_embeddings = np.asarray(stored['embeddings'], dtype=np.float32)
+                candidate_embeddings /= np.linalg.norm(candidate_embeddings, axis=1, keepdims=True) + 1e-12
+                similarities = candidate_embeddings @ query_embedding
+
+                trial_dict = {trial['trial_id']: trial for trial in matched_trials}
+                candidates = [trial_dict[doc_id] for doc_id in stored['ids']]
+                ranked_trials = select_top_trials(candidates, similarities, top_k)
+
+                print(f"Ranked {len(candidates)} trials using stored ChromaDB embeddings")
+                if top_k is not None and top_k > 0:
+                    print(f"Returning top {top_k} results")
+                return ranked_trials
+            results = None
         except Exception as e2:
-            print(f"Alternative query also failed: {e2}")
+            print(f"ID lookup also failed: {e2}")
             results = None
 
     # If we got results, process them
@@ -280,13 +500,16 @@ def rank_matched_trials(matched_trials, patient_data, chroma_path, top_k=None):
         # Create a dictionary to look up original trial data
         trial_dict = {trial['trial_id']: trial for trial in matched_trials}
 
+        # Report cosine similarity, as the saved-embedding and fallback rankings do
+        space = (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
         # Create list of ranked trials with scores
         ranked_trials = []
         for i, (doc_id, distance) in enumerate(zip(results['ids'][0], results['distances'][0])):
             if doc_id in trial_dict:
                 trial = trial_dict[doc_id]
                 # Add search score
-                trial['semantic_score'] = 1.0 - distance  # Convert distance to similarity score
+                trial['semantic_score'] = distance_to_cosine(distance, space)
                 ranked_trials.append(trial)
 
         print(f"Ranked {len(ranked_trials)} trials using semantic search")
@@ -302,33 +525,23 @@ def rank_matched_trials(matched_trials, patient_data, chroma_path, top_k=None):
 
         # FALLBACK: Calculate similarity scores manually
         try:
-            # Import required libraries
-            import numpy as np
-            from sklearn.metrics.pairwise import cosine_similarity
-
-            query_embedding = embedding_function([query])[0]
-            ranked_trials = []
+            fallback_embedding_function = get_fallback_embedding_function(embedding_function)
+            query_embedding = np.asarray(fallback_embedding_function([query])[0], dtype=np.float32)
 
             print(f"Calculating similarity scores for {len(matched_trials)} trials...")
-            for trial in matched_trials:
-                # Create a text representation of the trial
-                trial_text = f"{trial['trial_title']} {' '.join(trial['conditions'])}"
-                trial_embedding = embedding_function([trial_text])[0]
+            # Create a text representation of each trial and encode them in one batch
+            trial_texts = [f"{trial['trial_title']} {' '.join(trial['conditions'])}" for trial in matched_trials]
+            trial_embeddings = encode_length_sorted(fallback_embedding_function, trial_texts)
 
-                # Calculate cosine similarity
-                similarity = cosine_similarity([query_embedding], [trial_embedding])[0][0]
+            # Cosine similarity for all trials as a single matrix-vector product of unit vectors
+            trial_embeddings /= np.linalg.norm(trial_embeddings, axis=1, keepdims=True) + 1e-12
+            query_embedding /= np.linalg.norm(query_embedding) + 1e-12
+            similarities = trial_embeddings @ query_embedding
 
-                # Add score to trial
-                trial['semantic_score'] = float(similarity)
-                ranked_trials.append(trial)
-
-            # Sort by score
-            ranked_trials = sorted(ranked_trials, key=lambda x: x['semantic_score'], reverse=True)
-            print(f"Ranked {len(ranked_trials)} trials using fallback semantic ranking")
+            ranked_trials = select_top_trials(matched_trials, similarities, top_k)
 
-            # Limit to top_k if specified
+            print(f"Ranked {len(matched_trials)} trials using fallback semantic ranking")
             if top_k is not None and top_k > 0:
-                ranked_trials = ranked_trials[:top_k]
                 print(f"Returning top {top_k} results")
 
             return ranked_trials
@@ -337,8 +550,8 @@ def rank_matched_trials(matched_trials, patient_data, chroma_path, top_k=None):
             print("Returning unranked trials")
             return matched_trials
 
-def print_trial_summary(trial, file=None):
-    """Print a summarized version of a trial document"""
+def format_trial_summary(trial):
+    """Format a summarized version of a trial document, followed by a separator line"""
     # Format the trial information
     trial_summary = [
         f"Trial ID: {trial.get('trial_id', 'N/A')}",
@@ -351,17 +564,16 @@ def print_trial_summary(trial, file=None):
 
     # Filter out empty lines
     trial_summary = [line for line in trial_summary if line]
+    trial_summary.append("-" * 50)
 
-    # Print to file if specified, otherwise to console
-    if file:
-        print("\n".join(trial_summary), file=file)
-        print("-" * 50, file=file)
-    else:
-        print("\n".join(trial_summary))
-        print("-" * 50)
+    return "\n".join(trial_summary)
 
-def print_patient_summary(patient_data, file=None):
-    """Print a nicely formatted summary of the patient data"""
+def print_trial_summary(trial, file=None):
+    """Print a summarized version of a trial document"""
+    print(format_trial_summary(trial), file=file)
+
+def format_patient_summary(patient_data):
+    """Format a nicely formatted summary of the patient data, followed by a separator line"""
     # Check if we have extracted key clinical info
     if "key_clinical_info" in patient_data:
         key_info = patient_data["key_clinical_info"]
@@ -415,13 +627,13 @@ def print_patient_summary(patient_data, file=None):
             dose = f"{med.get('dose', '')} {med.get('unit', '')}"
             patient_summary.append(f"- {name} {dose}")
 
-    # Print to file if specified, otherwise to console
-    if file:
-        print("\n".join(patient_summary), file=file)
-        print("=" * 50, file=file)
-    else:
-        print("\n".join(patient_summary))
-        print("=" * 50)
+    patient_summary.append("=" * 50)
+
+    return "\n".join(patient_summary)
+
+def print_patient_summary(patient_data, file=None):
+    """Print a nicely formatted summary of the patient data"""
+    print(format_patient_summary(patient_data), file=file)
 
 def match_and_rank_trials(file_path, db_path, chroma_path, output_path, top_k=None):
     """
@@ -434,9 +646,6 @@ def match_and_rank_trials(file_path, db_path, chroma_path, output_path, top_k=No
         output_path: Path to save results
         top_k: Number of top results to return (None for all)
     """
-    # Register namespaces (required for proper XML parsing)
-    register_namespaces()
-
     print(f"Parsing file: {file_path}")
 
     # Parse the file
@@ -466,45 +675,70 @@ def match_and_rank_trials(file_path, db_path, chroma_path, output_path, top_k=No
     print("\nRanking matched trials using enhanced semantic search query...")
     ranked_trials = rank_matched_trials(matched_trials, patient_data, chroma_path, top_k)
 
-    # Make sure the output directory exists for the specified output_path
-    output_dir = os.path.dirname(output_path)
-    if output_dir:  # Only create if there's a directory specified
-        os.makedirs(output_dir, exist_ok=True)
+    # Build the text report and write it in one go
+    report = [
+        format_patient_summary(patient_data),
+        f"\n=== RANKED MATCHING TRIALS ({len(ranked_trials)} of {total_matches} total) ===\n"
+    ]
+    for i, trial in enumerate(ranked_trials):
+        report.append(f"Rank #{i+1}")
+        report.append(format_trial_summary(trial))
 
-    # Write results to output file
     with open(output_path, 'w') as f:
-        # Write enhanced patient summary
-        print_patient_summary(patient_data, f)
-
-        f.write(f"\n=== RANKED MATCHING TRIALS ({len(ranked_trials)} of {total_matches} total) ===\n\n")
-
-        # Write each trial
-        for i, trial in enumerate(ranked_trials):
-            f.write(f"Rank #{i+1}\n")
-            print_trial_summary(trial, f)
+        f.write("\n".join(report) + "\n")
 
     print(f"\nResults saved to {output_path}")
 
     # Also save full JSON data
     json_output_path = os.path.splitext(output_path)[0] + ".json"
-    with open(json_output_path, 'w') as f:
-        json.dump({
+    with open(json_output_path, 'wb') as f:
+        f.write(orjson.dumps({
             "patient": {
                 "patientId": patient_data.get("patientId"),
                 "key_clinical_info": patient_data.get("key_clinical_info", {})
             },
             "matched_trials": ranked_trials,
             "total_matches": total_matches
-        }, f, indent=2)
+        }, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
 
     print(f"Complete data saved to {json_output_path}")
 
-    # Display top 5 results on console
+    # Display top 5 results on console with a single write
     display_count = min(5, len(ranked_trials))
-    print(f"\n=== TOP {display_count} RANKED TRIALS ===")
+    top_trials = [f"\n=== TOP {display_count} RANKED TRIALS ==="]
     for i in range(display_count):
-        print(f"\nRank #{i+1}")
-        print_trial_summary(ranked_trials[i])
+        top_trials.append(f"\nRank #{i+1}")
+        top_trials.append(format_trial_summary(ranked_trials[i]))
+    print("\n".join(top_trials))
+
+def match_and_rank_trials_batch(file_paths, db_path, chroma_path, output_dir, top_k=None, max_workers=2):
+    """
+    Match and rank clinical trials for several patients concurrently
+
+    Each patient's results are written to <output_dir>/<patient file name>_matched_trials.txt
+    (plus the matching .json). All workers share the cached ChromaDB collection and model.
+
+    Args:
+        file_paths: Paths to the C-CDA XML files
+        db_path: Path to the SQLite database containing clinical trials
+        chroma_path: Path to the ChromaDB directory
+        output_dir: Directory to save results
+        top_k: Number of top results to return (None for all)
+        max_workers: Number of patients processed at once (ChromaDB throughput peaks at 2)
+    """
+    # Load the collection and model once before the workers start sharing them
+    try:
+        _get_collection(chroma_path, EMBEDDING_MODEL_NAME)
+    except Exception as e:
+        print(f"Error connecting to ChromaDB collection: {e}")
+
+    def process_one(file_path):
+        patient_name = os.path.splitext(os.path.basename(file_path))[0]
+        output_path = os.path.join(output_dir, f"{patient_name}_matched_trials.txt")
+        match_and_rank_trials(file_path, db_path, chroma_path, output_path, top_k)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(process_one, file_paths))
 
 def main():
     parser = argparse.ArgumentParser(description="Match and rank clinical trials for a patient")
@@ -523,17 +757,25 @@ def main():
     parser.add_argument("--top", "-k", type=int,
                     default=10,
                     help="Number of top results to return (default: 10)")
+    parser.add_argument("--patients-glob", "-g", type=str,
+                    default=None,
+                    help="Glob of C-CDA XML files to process as a batch; results go to the --output directory")
 
     args = parser.parse_args()
 
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(args.output) if os.path.dirname(args.output) else '.', exist_ok=True)
+    configure_torch_threads()
 
+    # Ensure output directory exists
     output_dir = os.path.dirname(args.output)
     if output_dir:  # Only create if there's a directory specified
         os.makedirs(output_dir, exist_ok=True)
 
-    match_and_rank_trials(args.patient, args.sqlite, args.chroma, args.output, args.top)
+    if args.patients_glob:
+        patient_files = sorted(glob.glob(args.patients_glob))
+        print(f"Processing {len(patient_files)} patient files matching {args.patients_glob}")
+        match_and_rank_trials_batch(patient_files, args.sqlite, args.chroma, output_dir or '.', args.top)
+    else:
+        match_and_rank_trials(args.patient, args.sqlite, args.chroma, args.output, args.top)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 import os
+import re
 import json
 import argparse
-import pandas as pd
 from datetime import datetime
 import sys
 import logging
-import glob
-import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
+
+# pandas is imported inside the functions that build DataFrames, so importing this
+# module or running --help does not pay its start-up cost
+
+# orjson is optional; fall back to the standard library parser without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +26,123 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _today():
+    """
+    Return today's date as a YYYYMMDD file name stamp. generate_output takes one stamp
+    per run and passes it down, so every file of a run shares it even across midnight.
+
+    Returns:
+        Date stamp string
+    """
+    return datetime.now().strftime("%Y%m%d")
+
+def _iso_date(date_stamp):
+    """
+    Format a YYYYMMDD date stamp as a YYYY-MM-DD date.
+
+    Args:
+        date_stamp: YYYYMMDD date stamp
+
+    Returns:
+        ISO date string
+    """
+    return f"{date_stamp[:4]}-{date_stamp[4:6]}-{date_stamp[6:8]}"
+
+# ClinicalTrials.gov study page; the trial ID is appended to form each link
+STUDY_URL_PREFIX = "https://clinicaltrials.gov/study/"
+
+# Display labels for the LLM's confidence levels, in ascending order
+_CONF_CAP = {"low": "Low", "medium": "Medium", "high": "High"}
+CONFIDENCE_LEVELS = ["Low", "Medium", "High"]
+
+def confidence_label(confidence):
+    """
+    Return the display label for an LLM confidence level, matching the known levels
+    case-insensitively and capitalizing any other value.
+
+    Args:
+        confidence: Confidence level reported for a criterion
+
+    Returns:
+        Display label string
+    """
+    confidence = str(confidence)
+    label = _CONF_CAP.get(confidence.lower())
+    return label if label is not None else confidence.capitalize()
+
+# Characters of the first unmet criterion and rationale shown as an ineligible trial's primary reason
+PRIMARY_REASON_LENGTH = 100
+
+# Write the multi-patient summary as CSV files instead of a workbook (FAST_SUMMARY=1)
+FAST_SUMMARY = os.environ.get("FAST_SUMMARY", "0") == "1"
+
+# Count columns of the cross-patient summary sheet
+SUMMARY_COUNT_DTYPES = {
+    "Total Trials Evaluated": "int32",
+    "Eligible Trials": "int32",
+    "Ineligible Trials": "int32"
+}
+
+def add_link_column(df):
+    """
+    Append a Link column to the ClinicalTrials.gov study page of each row's Trial ID,
+    built in one vectorized string concatenation (Arrow-backed when pyarrow is installed).
+
+    Args:
+        df: DataFrame with a "Trial ID" column
+    """
+    try:
+        import pyarrow
+        dtype = "string[pyarrow]"
+    except ImportError:
+        dtype = "string"
+
+    df["Link"] = STUDY_URL_PREFIX + df["Trial ID"].astype(dtype)
+
+def write_json(output_file, data):
+    """
+    Serialize data to indented JSON, using orjson when it is installed, and write it
+    in a single buffered write.
+
+    The data is written to a uniquely named temporary sibling file that then replaces
+    output_file, so a crash mid-write never leaves a truncated JSON file behind for the
+    next run to load, and concurrent writers of the same path never share a temp file.
+
+    Args:
+        output_file: Path of the JSON file to write
+        data: JSON-serializable data
+    """
+    if orjson:
+        # NumPy scalars (e.g. semantic scores) serialize natively instead of raising
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        payload = json.dumps(data, indent=2).encode("utf-8")
+
+    # Created exclusively with the usual permissions (mkstemp would make it owner-only)
+    temp_file = f"{output_file}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_file, 'xb', buffering=1 << 20) as f:
+            f.write(payload)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def read_json(input_file):
+    """
+    Read and parse a JSON file, using orjson when it is installed.
+
+    Args:
+        input_file: Path of the JSON file to read
+
+    Returns:
+        Parsed JSON data
+    """
+    with open(input_file, 'rb') as f:
+        data = f.read()
+    return orjson.loads(data) if orjson else json.loads(data)
+
 def load_eligibility_results(input_path):
     """
     Load eligibility results from a JSON file.
@@ -26,16 +153,34 @@ def load_eligibility_results(input_path):
     Returns:
         Dictionary containing eligibility results
     """
-    logger.info(f"Loading eligibility results from {input_path}")
+    logger.info("Loading eligibility results from %s", input_path)
     try:
-        with open(input_path, 'r') as f:
-            results = json.load(f)
-            logger.info(f"Successfully loaded results for patient {results.get('patient_id', 'Unknown')}")
-            return results
+        results = read_json(input_path)
+        logger.info("Successfully loaded results for patient %s", results.get('patient_id', 'Unknown'))
+        return results
     except Exception as e:
-        logger.error(f"Error loading eligibility results: {str(e)}")
+        logger.error("Error loading eligibility results: %s", e)
         return None
 
+def sort_by_semantic_score(trials):
+    """
+    Sort trial dictionaries by descending semantic score with a NumPy argsort over the
+    score column; trials with equal scores keep their original order.
+
+    Args:
+        trials: List of trial dictionaries with a "semantic_score" key
+
+    Returns:
+        New sorted list of the same trial dictionaries
+    """
+    if len(trials) < 2:
+        return trials
+
+    import numpy as np
+
+    scores = np.fromiter((trial["semantic_score"] for trial in trials), dtype=np.float64, count=len(trials))
+    return [trials[i] for i in np.argsort(-scores, kind="stable")]
+
 def format_simple_results(eligibility_results):
     """
     Format eligibility results into a simple format that only includes
@@ -47,55 +192,57 @@ def format_simple_results(eligibility_results):
     Returns:
         Dictionary with simplified results containing only matched trials
     """
-    patient_id = eligibility_results.get("patient_id", "unknown")
-    eligible_trials = []
+    return format_both(eligibility_results)[1]
 
-    # Check the trial results
-    trial_results = eligibility_results.get("results", [])
 
-    for trial in trial_results:
-        # Skip if there's an error or no evaluation
-        if 'error' in trial or 'evaluation' not in trial:
-            continue
+def format_results_for_output(eligibility_results):
+    """
+    Format eligibility results into a structured format for output.
 
-        evaluation = trial.get('evaluation', [])
+    Args:
+        eligibility_results: Dictionary containing eligibility results
 
-        # Check if all criteria are met (this is how eligibility is determined)
-        all_criteria_met = all(criterion.get('is_met', False) for criterion in evaluation)
+    Returns:
+        Dictionary with formatted results
+    """
+    return format_both(eligibility_results)[0]
 
-        if all_criteria_met:
-            # Extract only criteria names that were met
-            criteria_met = [criterion.get("criterion", "") for criterion in evaluation
-                        if criterion.get("is_met") == True]
 
-            if criteria_met:  # Only include trials where criteria are met
-                eligible_trials.append({
-                    "trialId": trial.get("trial_id", ""),
-                    "trialName": trial.get("trial_title", ""),
-                    "eligibilityCriteriaMet": criteria_met
-                })
+def format_both(eligibility_results):
+    """
+    Format eligibility results into both the detailed and the simple output formats
+    in a single pass over the trial results.
 
-    return {
-        "patientId": patient_id,
-        "eligibleTrials": eligible_trials
-    }
+    Args:
+        eligibility_results: Dictionary containing eligibility results
 
+    Returns:
+        Tuple of (formatted results, simple results), as returned by
+        format_results_for_output and format_simple_results
+    """
+    return _format_results(eligibility_results)[:2]
 
-def format_results_for_output(eligibility_results):
+
+def _format_results(eligibility_results, evaluation_date=None):
     """
-    Format eligibility results into a structured format for output.
+    Format eligibility results as format_both does, also returning the unmet criteria
+    bookkeeping create_dataframes would otherwise rescan the ineligible trials for.
 
     Args:
         eligibility_results: Dictionary containing eligibility results
+        evaluation_date: YYYY-MM-DD date used when the results carry none
+            (defaults to today)
 
     Returns:
-        Dictionary with formatted results
+        Tuple of (formatted results, simple results, unmet criteria), where unmet
+        criteria holds an (unmet count, index of the first unmet criterion) pair for
+        each of the formatted results' ineligible trials, in the same order
     """
-    logger.info("Formatting results for output")
+    logger.debug("Formatting results for output")
 
     patient_id = eligibility_results.get('patient_id', 'Unknown')
-    evaluation_date = eligibility_results.get('evaluation_date', datetime.now().strftime("%Y-%m-%d"))
-    trial_results = eligibility_results.get('results', [])
+    evaluation_date = eligibility_results.get('evaluation_date', evaluation_date or _iso_date(_today()))
+    trial_results = eligibility_results.get('results') or ()
 
     # Create structured output
     formatted_output = {
@@ -106,6 +253,10 @@ def format_results_for_output(eligibility_results):
         "ineligible_trials": [],
         "indeterminate_trials": []
     }
+    simple_trials = []
+    # (unmet count, first unmet index) per ineligible trial summary, keyed by id() so the
+    # output dictionaries carry no bookkeeping fields
+    unmet_by_trial = {}
 
     # Process each trial result
     for trial in trial_results:
@@ -124,341 +275,420 @@ def format_results_for_output(eligibility_results):
             continue
 
         # Get evaluation criteria
-        evaluation = trial.get('evaluation', [])
-
-        # Check if all criteria are met
-        all_criteria_met = all(criterion.get('is_met', False) for criterion in evaluation)
-        high_confidence = all(criterion.get('confidence', 'low') != 'low' for criterion in evaluation)
+        evaluation = trial.get('evaluation') or ()
 
-        # Create trial summary
-        trial_summary = {
-            "trial_id": trial_id,
-            "trial_title": trial_title,
-            "semantic_score": semantic_score,
-            "criteria_summary": []
-        }
+        # Summarize each criterion, track unmet criteria and collect the names of
+        # met criteria for the simple format in a single pass
+        criteria_summary = []
+        criteria_met = []
+        unmet_count = 0
+        first_unmet = None
 
-        # Add each criterion evaluation
         for criterion in evaluation:
-            criterion_summary = {
+            is_met = criterion.get('is_met', False)
+            if not is_met:
+                if first_unmet is None:
+                    first_unmet = len(criteria_summary)
+                unmet_count += 1
+            elif is_met == True:
+                criteria_met.append(criterion.get("criterion", ""))
+
+            criteria_summary.append({
                 "criterion": criterion.get('criterion', 'Unknown'),
-                "is_met": criterion.get('is_met', False),
+                "is_met": is_met,
                 "confidence": criterion.get('confidence', 'low'),
                 "rationale": criterion.get('rationale', ''),
                 "medications_and_supplements": criterion.get('medications_and_supplements', [])
-            }
-            trial_summary["criteria_summary"].append(criterion_summary)
+            })
 
-        # Add to appropriate category
-        if all_criteria_met:
+        # Create trial summary with each criterion evaluation
+        trial_summary = {
+            "trial_id": trial_id,
+            "trial_title": trial_title,
+            "semantic_score": semantic_score,
+            "criteria_summary": criteria_summary
+        }
+
+        # Add to appropriate category; a trial is eligible only if every criterion is met
+        if unmet_count == 0:
             formatted_output["eligible_trials"].append(trial_summary)
+
+            if criteria_met:  # Only include trials where criteria are met
+                simple_trials.append({
+                    "trialId": trial.get("trial_id", ""),
+                    "trialName": trial.get("trial_title", ""),
+                    "eligibilityCriteriaMet": criteria_met
+                })
         else:
             formatted_output["ineligible_trials"].append(trial_summary)
+            unmet_by_trial[id(trial_summary)] = (unmet_count, first_unmet)
 
     # Sort trials by semantic score
-    formatted_output["eligible_trials"].sort(key=lambda x: x["semantic_score"], reverse=True)
-    formatted_output["ineligible_trials"].sort(key=lambda x: x["semantic_score"], reverse=True)
-    formatted_output["indeterminate_trials"].sort(key=lambda x: x["semantic_score"], reverse=True)
-
-    logger.info(f"Found {len(formatted_output['eligible_trials'])} eligible trials, "
-                f"{len(formatted_output['ineligible_trials'])} ineligible trials, and "
-                f"{len(formatted_output['indeterminate_trials'])} indeterminate trials")
+    for category in ("eligible_trials", "ineligible_trials", "indeterminate_trials"):
+        formatted_output[category] = sort_by_semantic_score(formatted_output[category])
+    unmet_criteria = [unmet_by_trial[id(trial)] for trial in formatted_output["ineligible_trials"]]
+
+    logger.info("Found %s eligible trials, %s ineligible trials, and %s indeterminate trials",
+                len(formatted_output['eligible_trials']),
+                len(formatted_output['ineligible_trials']),
+                len(formatted_output['indeterminate_trials']))
+
+    simple_output = {
+        "patientId": eligibility_results.get("patient_id", "unknown"),
+        "eligibleTrials": simple_trials
+    }
 
-    return formatted_output
+    return formatted_output, simple_output, unmet_criteria
 
-def save_json_output(formatted_results, output_dir):
+def save_json_output(formatted_results, output_dir, date_stamp=None):
     """
     Save formatted results to a JSON file.
 
     Args:
         formatted_results: Dictionary with formatted eligibility results
-        output_dir: Directory to save the output file
+        output_dir: Existing directory to save the output file
+        date_stamp: YYYYMMDD stamp for the file name (defaults to today)
 
     Returns:
         Path to the saved JSON file
     """
     patient_id = formatted_results.get("patient_id", "unknown")
-    date_stamp = datetime.now().strftime("%Y%m%d")
+    if date_stamp is None:
+        date_stamp = _today()
     output_file = os.path.join(output_dir, f"patient_{patient_id}_eligibility_{date_stamp}.json")
 
-    os.makedirs(output_dir, exist_ok=True)
-
     try:
-        with open(output_file, 'w') as f:
-            json.dump(formatted_results, f, indent=2)
-        logger.info(f"JSON results saved to {output_file}")
+        write_json(output_file, formatted_results)
+        logger.info("JSON results saved to %s", output_file)
         return output_file
     except Exception as e:
-        logger.error(f"Error saving JSON results: {str(e)}")
+        logger.error("Error saving JSON results: %s", e)
         return None
 
 def create_simple_dataframe(formatted_results):
     # formatted_results is the output from format_simple_results
-    patient_id = formatted_results.get("patientId", "unknown")
-    rows = []
-    for trial in formatted_results.get("eligibleTrials", []):
-        rows.append({
-            "Patient ID": patient_id,
-            "Trial ID": trial.get("trialId", ""),
-            "Trial Name": trial.get("trialName", ""),
-            # Join the list of met criteria into a single string (or keep it as a list if preferred)
-            "Eligibility Criteria Met": ", ".join(trial.get("eligibilityCriteriaMet", []))
-        })
-    return pd.DataFrame(rows)
+    return create_simple_dataframe_all([formatted_results])
+
+def create_simple_dataframe_all(simple_results_list):
+    """
+    Flatten the simple results of several patients into one DataFrame, one row per
+    eligible trial, in a single pass over the records.
+
+    Args:
+        simple_results_list: List of outputs from format_simple_results
+
+    Returns:
+        DataFrame with Patient ID, Trial ID, Trial Name and Eligibility Criteria Met columns
+    """
+    import pandas as pd
+
+    simple_columns = {
+        "Patient ID": [],
+        "Trial ID": [],
+        "Trial Name": [],
+        "Eligibility Criteria Met": []
+    }
+    for simple_results in simple_results_list:
+        patient_id = simple_results.get("patientId", "unknown")
+        for trial in simple_results.get("eligibleTrials") or ():
+            simple_columns["Patient ID"].append(patient_id)
+            simple_columns["Trial ID"].append(trial.get("trialId", ""))
+            simple_columns["Trial Name"].append(trial.get("trialName", ""))
+            # Join the list of met criteria into a single string
+            simple_columns["Eligibility Criteria Met"].append(", ".join(trial.get("eligibilityCriteriaMet") or ()))
 
+    return pd.DataFrame(simple_columns, copy=False)
 
-def create_dataframes(formatted_results):
+
+def create_dataframes(formatted_results, unmet_criteria=None):
     """
     Create pandas DataFrames for Excel output.
 
     Args:
         formatted_results: Dictionary with formatted eligibility results
+        unmet_criteria: Optional (unmet count, first unmet index) pairs for the ineligible
+            trials, as returned by _format_results; without them the criteria are scanned
 
     Returns:
-        Tuple of DataFrames (summary_df, eligible_df, ineligible_df, eligible_criteria_df)
+        Tuple of DataFrames (summary_df, eligible_df, ineligible_df, eligible_criteria_df);
+        the last three are None when the patient has no trials in that category
     """
-    logger.info("Creating DataFrames for Excel output")
+    import pandas as pd
+
+    logger.debug("Creating DataFrames for Excel output")
 
     patient_id = formatted_results.get("patient_id", "Unknown")
     evaluation_date = formatted_results.get("evaluation_date", "Unknown")
+    eligible_trials = formatted_results.get("eligible_trials") or []
+    ineligible_trials = formatted_results.get("ineligible_trials") or []
 
     # Create summary DataFrame
     summary_data = {
         "Patient ID": [patient_id],
         "Evaluation Date": [evaluation_date],
         "Total Trials Evaluated": [formatted_results.get("total_trials_evaluated", 0)],
-        "Eligible Trials": [len(formatted_results.get("eligible_trials", []))],
-        "Ineligible Trials": [len(formatted_results.get("ineligible_trials", []))],
-        "Indeterminate Trials": [len(formatted_results.get("indeterminate_trials", []))]
+        "Eligible Trials": [len(eligible_trials)],
+        "Ineligible Trials": [len(ineligible_trials)],
+        "Indeterminate Trials": [len(formatted_results.get("indeterminate_trials") or [])]
     }
     summary_df = pd.DataFrame(summary_data)
 
-    # Create eligible trials DataFrame
-    eligible_trials = formatted_results.get("eligible_trials", [])
-    eligible_data = []
+    # Create eligible trials DataFrame, built column by column
+
+    if eligible_trials:
+        eligible_df = pd.DataFrame({
+            "Trial ID": [trial.get("trial_id", "") for trial in eligible_trials],
+            "Trial Title": [trial.get("trial_title", "") for trial in eligible_trials],
+            "Semantic Score": [trial.get("semantic_score", 0) for trial in eligible_trials],
+            "Number of Criteria": [len(trial.get("criteria_summary") or ()) for trial in eligible_trials],
+            "All Criteria Met": "Yes"
+        }, copy=False)
+        add_link_column(eligible_df)
+    else:
+        eligible_df = None
+
+    # Create ineligible trials DataFrame
+    ineligible_ids = []
+    ineligible_titles = []
+    ineligible_scores = []
+    unmet_counts = []
+    primary_reasons = []
+
+    for i, trial in enumerate(ineligible_trials):
+        criteria_summary = trial.get("criteria_summary") or ()
+
+        # Use the unmet count and first unmet criterion recorded while formatting when
+        # they were passed in; otherwise (e.g. results reloaded from JSON) scan once
+        if unmet_criteria is not None:
+            unmet_count, first_unmet_index = unmet_criteria[i]
+            first_unmet = criteria_summary[first_unmet_index] if first_unmet_index is not None else None
+        else:
+            unmet_count = 0
+            first_unmet = None
+            for criterion in criteria_summary:
+                if not criterion.get("is_met", False):
+                    unmet_count += 1
+                    if first_unmet is None:
+                        first_unmet = criterion
+
+        # Only the start of the rationale can appear in the truncated reason
+        if first_unmet:
+            unmet_reason = f"{first_unmet.get('criterion', '')}: {first_unmet.get('rationale', '')[:PRIMARY_REASON_LENGTH + 1]}"
+        else:
+            unmet_reason = "Unknown"
+
+        ineligible_ids.append(trial.get("trial_id", ""))
+        ineligible_titles.append(trial.get("trial_title", ""))
+        ineligible_scores.append(trial.get("semantic_score", 0))
+        unmet_counts.append(unmet_count)
+        primary_reasons.append(unmet_reason[:PRIMARY_REASON_LENGTH] + "..." if len(unmet_reason) > PRIMARY_REASON_LENGTH else unmet_reason)
+
+    if ineligible_trials:
+        ineligible_df = pd.DataFrame({
+            "Trial ID": ineligible_ids,
+            "Trial Title": ineligible_titles,
+            "Semantic Score": ineligible_scores,
+            "Unmet Criteria": unmet_counts,
+            "Primary Reason": primary_reasons
+        }, copy=False)
+        add_link_column(ineligible_df)
+    else:
+        ineligible_df = None
+
+    # Create detailed criteria DataFrame for eligible trials, one row per criterion;
+    # trial ID and title are read once per trial and each criterion dict is read once
+    # into a (criterion, is met, confidence, rationale, medications) tuple
+    criteria_trial_ids = []
+    criteria_trial_titles = []
+    criteria_rows = []
 
     for trial in eligible_trials:
-        row = {
-            "Trial ID": trial.get("trial_id", ""),
-            "Trial Title": trial.get("trial_title", ""),
-            "Semantic Score": trial.get("semantic_score", 0),
-            "Number of Criteria": len(trial.get("criteria_summary", [])),
-            "All Criteria Met": "Yes",
-            "Link": f"https://clinicaltrials.gov/study/{trial.get('trial_id', '')}"
-        }
-        eligible_data.append(row)
+        criteria_summary = trial.get("criteria_summary") or ()
+        criteria_count = len(criteria_summary)
+        criteria_trial_ids.extend([trial.get("trial_id", "")] * criteria_count)
+        criteria_trial_titles.extend([trial.get("trial_title", "")] * criteria_count)
+        criteria_rows.extend(
+            (criterion.get("criterion", ""),
+             "Yes" if criterion.get("is_met", False) else "No",
+             confidence_label(criterion.get("confidence", "")),
+             criterion.get("rationale", ""),
+             ", ".join(criterion.get("medications_and_supplements") or ()))
+            for criterion in criteria_summary
+        )
+
+    if criteria_rows:
+        names, met, confidences, rationales, medications = zip(*criteria_rows)
+        # Levels outside Low/Medium/High are kept, ordered after the known ones
+        extra_levels = sorted(set(confidences).difference(CONFIDENCE_LEVELS))
+        eligible_criteria_df = pd.DataFrame({
+            "Trial ID": criteria_trial_ids,
+            "Trial Title": criteria_trial_titles,
+            "Criterion": names,
+            "Is Met": pd.Categorical(met),
+            "Confidence": pd.Categorical(confidences, categories=CONFIDENCE_LEVELS + extra_levels, ordered=True),
+            "Rationale": rationales,
+            "Medications": medications
+        }, copy=False)
+    else:
+        eligible_criteria_df = None
 
-    eligible_df = pd.DataFrame(eligible_data) if eligible_data else pd.DataFrame()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Created DataFrames: Summary (%s rows), Eligible (%s rows), "
+                     "Ineligible (%s rows), Criteria Detail (%s rows)",
+                     len(summary_df),
+                     len(eligible_df) if eligible_df is not None else 0,
+                     len(ineligible_df) if ineligible_df is not None else 0,
+                     len(eligible_criteria_df) if eligible_criteria_df is not None else 0)
 
-    # Create ineligible trials DataFrame
-    ineligible_trials = formatted_results.get("ineligible_trials", [])
-    ineligible_data = []
-
-    for trial in ineligible_trials:
-        # Count unmet criteria
-        criteria_summary = trial.get("criteria_summary", [])
-        unmet_criteria = sum(1 for c in criteria_summary if not c.get("is_met", False))
-
-        # Find first unmet criterion for summary
-        first_unmet = next((c for c in criteria_summary if not c.get("is_met", False)), None)
-        unmet_reason = first_unmet.get("criterion", "") + ": " + first_unmet.get("rationale", "") if first_unmet else "Unknown"
-
-        row = {
-            "Trial ID": trial.get("trial_id", ""),
-            "Trial Title": trial.get("trial_title", ""),
-            "Semantic Score": trial.get("semantic_score", 0),
-            "Unmet Criteria": unmet_criteria,
-            "Primary Reason": unmet_reason[:100] + "..." if len(unmet_reason) > 100 else unmet_reason,
-            "Link": f"https://clinicaltrials.gov/study/{trial.get('trial_id', '')}"
-        }
-        ineligible_data.append(row)
+    return summary_df, eligible_df, ineligible_df, eligible_criteria_df
 
-    ineligible_df = pd.DataFrame(ineligible_data) if ineligible_data else pd.DataFrame()
+def open_excel_writer(output_file, constant_memory=False):
+    """
+    Open a pandas ExcelWriter, preferring the faster xlsxwriter engine and
+    falling back to openpyxl when xlsxwriter is not installed.
 
-    # Create detailed criteria DataFrame for eligible trials
-    eligible_criteria_data = []
+    Args:
+        output_file: Path of the Excel file to write
+        constant_memory: Stream rows to disk instead of holding the workbook in memory
+            (xlsxwriter constant_memory mode, or an openpyxl write-only workbook), so
+            sheets must be filled with write_sheet rather than to_excel
 
-    for trial in eligible_trials:
-        trial_id = trial.get("trial_id", "")
-        trial_title = trial.get("trial_title", "")
-
-        for criterion in trial.get("criteria_summary", []):
-            row = {
-                "Trial ID": trial_id,
-                "Trial Title": trial_title,
-                "Criterion": criterion.get("criterion", ""),
-                "Is Met": "Yes" if criterion.get("is_met", False) else "No",
-                "Confidence": criterion.get("confidence", "").capitalize(),
-                "Rationale": criterion.get("rationale", ""),
-                "Medications": ", ".join(criterion.get("medications_and_supplements", []))
-            }
-            eligible_criteria_data.append(row)
+    Returns:
+        pandas ExcelWriter
+    """
+    import pandas as pd
 
-    eligible_criteria_df = pd.DataFrame(eligible_criteria_data) if eligible_criteria_data else pd.DataFrame()
+    try:
+        import xlsxwriter
+        return pd.ExcelWriter(output_file, engine='xlsxwriter',
+                              engine_kwargs={'options': {'strings_to_urls': False,
+                                                         'constant_memory': constant_memory}})
+    except ImportError:
+        logger.info("xlsxwriter is not installed, using openpyxl")
+        return pd.ExcelWriter(output_file, engine='openpyxl',
+                              engine_kwargs={'write_only': True} if constant_memory else None)
+
+def write_sheet(writer, df, sheet_name):
+    """
+    Write a DataFrame to a new sheet without its index.
 
-    logger.info(f"Created DataFrames: Summary ({summary_df.shape[0]} rows), "
-                f"Eligible ({eligible_df.shape[0] if not eligible_df.empty else 0} rows), "
-                f"Ineligible ({ineligible_df.shape[0] if not ineligible_df.empty else 0} rows), "
-                f"Criteria Detail ({eligible_criteria_df.shape[0] if not eligible_criteria_df.empty else 0} rows)")
+    DataFrame.to_excel writes column by column, which loses data when xlsxwriter is in
+    constant_memory mode and is unsupported by openpyxl write-only workbooks, so in those
+    modes the header and rows are streamed in order.
 
-    return summary_df, eligible_df, ineligible_df, eligible_criteria_df
+    Args:
+        writer: pandas ExcelWriter returned by open_excel_writer
+        df: DataFrame to write
+        sheet_name: Name of the sheet to create
+    """
+    # Missing values are left as blank cells, as to_excel does
+    rows = ([None if value != value else value for value in row]
+            for row in df.itertuples(index=False, name=None))
+
+    if writer.engine == 'xlsxwriter' and writer.book.constant_memory:
+        worksheet = writer.book.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, df.columns, writer.book.add_format({'bold': True}))
+        for row_number, row in enumerate(rows, start=1):
+            worksheet.write_row(row_number, 0, row)
+    elif writer.engine == 'openpyxl' and writer.book.write_only:
+        worksheet = writer.book.create_sheet(sheet_name)
+        worksheet.append(list(df.columns))
+        for row in rows:
+            worksheet.append(row)
+    else:
+        df.to_excel(writer, sheet_name=sheet_name, index=False)
 
-def save_excel_output(dataframes, output_dir, patient_id):
+def save_excel_output(dataframes, output_dir, patient_id, simple_df=None, date_stamp=None):
     """
     Save DataFrames to an Excel file with improved error handling.
 
     Args:
         dataframes: Tuple of DataFrames (summary_df, eligible_df, ineligible_df, eligible_criteria_df)
-        output_dir: Directory to save the output file
+        output_dir: Existing directory to save the output file
         patient_id: Patient ID for the filename
+        simple_df: Optional simple-format DataFrame, written as a "Simple Eligible Trials"
+            sheet of the same workbook
+        date_stamp: YYYYMMDD stamp for the file name (defaults to today)
 
     Returns:
         Path to the saved Excel file
     """
     summary_df, eligible_df, ineligible_df, eligible_criteria_df = dataframes
 
-    date_stamp = datetime.now().strftime("%Y%m%d")
+    if date_stamp is None:
+        date_stamp = _today()
     output_file = os.path.join(output_dir, f"patient_{patient_id}_eligibility_{date_stamp}.xlsx")
 
-    os.makedirs(output_dir, exist_ok=True)
-
     try:
-        logger.info(f"Creating Excel file at {output_file}")
+        logger.info("Creating Excel file at %s", output_file)
 
         # Debug info about dataframes
-        logger.info(f"Summary DF shape: {summary_df.shape}")
-        logger.info(f"Eligible DF shape: {eligible_df.shape if not eligible_df.empty else '(empty)'}")
-        logger.info(f"Ineligible DF shape: {ineligible_df.shape if not ineligible_df.empty else '(empty)'}")
-        logger.info(f"Criteria DF shape: {eligible_criteria_df.shape if not eligible_criteria_df.empty else '(empty)'}")
-
-        # First check if pandas and openpyxl are properly installed
-        try:
-            import openpyxl
-            logger.info(f"Using openpyxl version: {openpyxl.__version__}")
-        except ImportError:
-            logger.error("openpyxl is not installed. Please install with: pip install openpyxl")
-            return None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Summary DF shape: %s", summary_df.shape)
+            logger.debug("Eligible DF shape: %s", eligible_df.shape if eligible_df is not None else '(empty)')
+            logger.debug("Ineligible DF shape: %s", ineligible_df.shape if ineligible_df is not None else '(empty)')
+            logger.debug("Criteria DF shape: %s", eligible_criteria_df.shape if eligible_criteria_df is not None else '(empty)')
 
         # Create writer
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            logger.info("Writing Summary sheet...")
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
+        with open_excel_writer(output_file, constant_memory=True) as writer:
+            logger.debug("Writing Summary sheet...")
+            write_sheet(writer, summary_df, 'Summary')
 
-            if not eligible_df.empty:
-                logger.info("Writing Eligible Trials sheet...")
-                eligible_df.to_excel(writer, sheet_name='Eligible Trials', index=False)
+            if eligible_df is not None:
+                logger.debug("Writing Eligible Trials sheet...")
+                write_sheet(writer, eligible_df, 'Eligible Trials')
             else:
-                logger.info("No eligible trials to write")
+                logger.debug("No eligible trials to write")
 
-            if not ineligible_df.empty:
-                logger.info("Writing Ineligible Trials sheet...")
-                ineligible_df.to_excel(writer, sheet_name='Ineligible Trials', index=False)
+            if ineligible_df is not None:
+                logger.debug("Writing Ineligible Trials sheet...")
+                write_sheet(writer, ineligible_df, 'Ineligible Trials')
             else:
-                logger.info("No ineligible trials to write")
+                logger.debug("No ineligible trials to write")
 
-            if not eligible_criteria_df.empty:
-                logger.info("Writing Eligibility Details sheet...")
-                eligible_criteria_df.to_excel(writer, sheet_name='Eligibility Details', index=False)
+            if eligible_criteria_df is not None:
+                logger.debug("Writing Eligibility Details sheet...")
+                write_sheet(writer, eligible_criteria_df, 'Eligibility Details')
             else:
-                logger.info("No eligibility details to write")
+                logger.debug("No eligibility details to write")
+
+            if simple_df is not None:
+                logger.debug("Writing Simple Eligible Trials sheet...")
+                write_sheet(writer, simple_df, 'Simple Eligible Trials')
 
         # Verify the file was created
         if os.path.exists(output_file):
-            logger.info(f"Excel file successfully created: {output_file}")
+            logger.info("Excel file successfully created: %s", output_file)
             return output_file
         else:
-            logger.error(f"Excel file was not created despite no exceptions: {output_file}")
-            return None
-
-    except Exception as e:
-        logger.error(f"Error saving Excel results: {str(e)}")
-        logger.error(f"Error traceback: {traceback.format_exc()}")
-
-        # Try alternative method using CSV files
-        try:
-            logger.info("Attempting alternative Excel creation method...")
-            return save_excel_output_alternative(dataframes, output_dir, patient_id)
-        except Exception as alt_e:
-            logger.error(f"Alternative method also failed: {str(alt_e)}")
+            logger.error("Excel file was not created despite no exceptions: %s", output_file)
             return None
 
-def save_excel_output_alternative(dataframes, output_dir, patient_id):
-    """
-    Alternative method to save DataFrames to an Excel file by first creating CSVs.
-
-    Args:
-        dataframes: Tuple of DataFrames
-        output_dir: Directory to save the output file
-        patient_id: Patient ID for the filename
-
-    Returns:
-        Path to the saved Excel file
-    """
-    summary_df, eligible_df, ineligible_df, eligible_criteria_df = dataframes
-
-    date_stamp = datetime.now().strftime("%Y%m%d")
-    base_name = f"patient_{patient_id}_eligibility_{date_stamp}"
-    csv_dir = os.path.join(output_dir, "temp_csv")
-    output_file = os.path.join(output_dir, f"{base_name}.xlsx")
-
-    os.makedirs(csv_dir, exist_ok=True)
-
-    try:
-        # Save each DataFrame as CSV
-        summary_csv = os.path.join(csv_dir, f"{base_name}_summary.csv")
-        eligible_csv = os.path.join(csv_dir, f"{base_name}_eligible.csv")
-        ineligible_csv = os.path.join(csv_dir, f"{base_name}_ineligible.csv")
-        details_csv = os.path.join(csv_dir, f"{base_name}_details.csv")
-
-        logger.info("Saving DataFrames as CSV files")
-        summary_df.to_csv(summary_csv, index=False)
-
-        if not eligible_df.empty:
-            eligible_df.to_csv(eligible_csv, index=False)
-
-        if not ineligible_df.empty:
-            ineligible_df.to_csv(ineligible_csv, index=False)
-
-        if not eligible_criteria_df.empty:
-            eligible_criteria_df.to_csv(details_csv, index=False)
-
-        # Now load CSVs and create Excel
-        logger.info("Creating Excel file from CSVs")
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            pd.read_csv(summary_csv).to_excel(writer, sheet_name='Summary', index=False)
-
-            if os.path.exists(eligible_csv):
-                pd.read_csv(eligible_csv).to_excel(writer, sheet_name='Eligible Trials', index=False)
-
-            if os.path.exists(ineligible_csv):
-                pd.read_csv(ineligible_csv).to_excel(writer, sheet_name='Ineligible Trials', index=False)
-
-            if os.path.exists(details_csv):
-                pd.read_csv(details_csv).to_excel(writer, sheet_name='Eligibility Details', index=False)
-
-        logger.info(f"Excel file successfully created: {output_file}")
-        return output_file
-
-    except Exception as e:
-        logger.error(f"Error in alternative Excel creation: {str(e)}")
+    except Exception:
+        logger.exception("Error saving Excel results")
         return None
 
-def create_consolidated_json(all_patient_results, output_dir):
+def create_consolidated_json(all_patient_results, output_dir, date_stamp=None):
     """
     Create a consolidated JSON file with data from all patients.
 
     Args:
         all_patient_results: List of formatted patient result dictionaries
         output_dir: Directory to save the consolidated file
+        date_stamp: YYYYMMDD stamp for the file name and generation date
+            (defaults to today)
 
     Returns:
         Path to the saved consolidated JSON file
     """
     logger.info("Creating consolidated JSON file with all patient data")
 
+    if date_stamp is None:
+        date_stamp = _today()
+
     # Create a consolidated structure
     consolidated_data = {
-        "generation_date": datetime.now().strftime("%Y-%m-%d"),
+        "generation_date": _iso_date(date_stamp),
         "total_patients": len(all_patient_results),
         "patients": []
     }
@@ -466,33 +696,31 @@ def create_consolidated_json(all_patient_results, output_dir):
     # Add summaries of each patient and their eligible trials
     for patient_result in all_patient_results:
         patient_id = patient_result.get("patient_id", "Unknown")
-        eligible_trials = patient_result.get("eligible_trials", [])
+        eligible_trials = patient_result.get("eligible_trials") or []
 
         patient_summary = {
             "patient_id": patient_id,
             "evaluation_date": patient_result.get("evaluation_date", "Unknown"),
             "total_trials_evaluated": patient_result.get("total_trials_evaluated", 0),
             "eligible_trials_count": len(eligible_trials),
-            "ineligible_trials_count": len(patient_result.get("ineligible_trials", [])),
+            "ineligible_trials_count": len(patient_result.get("ineligible_trials") or []),
             "eligible_trials": eligible_trials
         }
 
         consolidated_data["patients"].append(patient_summary)
 
     # Save consolidated JSON
-    date_stamp = datetime.now().strftime("%Y%m%d")
     output_file = os.path.join(output_dir, f"all_patients_consolidated_{date_stamp}.json")
 
     try:
-        with open(output_file, 'w') as f:
-            json.dump(consolidated_data, f, indent=2)
-        logger.info(f"Consolidated JSON saved to {output_file}")
+        write_json(output_file, consolidated_data)
+        logger.info("Consolidated JSON saved to %s", output_file)
         return output_file
     except Exception as e:
-        logger.error(f"Error saving consolidated JSON: {str(e)}")
+        logger.error("Error saving consolidated JSON: %s", e)
         return None
 
-def create_comprehensive_excel(all_patient_results, output_dir):
+def create_comprehensive_excel(all_patient_results, output_dir, date_stamp=None):
     """
     Create a comprehensive Excel file with detailed data from all patients.
 
@@ -503,164 +731,251 @@ def create_comprehensive_excel(all_patient_results, output_dir):
     Returns:
         Path to the saved comprehensive Excel file
     """
+    import numpy as np
+    import pandas as pd
+
     logger.info("Creating comprehensive Excel file with all patient data")
 
-    # Prepare DataFrames
+    # Prepare DataFrames, one list per column
     # 1. Patient summary
-    patient_summary_data = []
+    patient_summary_columns = {
+        "Patient ID": [],
+        "Evaluation Date": [],
+        "Total Trials Evaluated": [],
+        "Eligible Trials": [],
+        "Ineligible Trials": [],
+        "Indeterminate Trials": []
+    }
     # 2. All eligible trials
-    all_eligible_trials_data = []
+    eligible_trials_columns = {
+        "Patient ID": [],
+        "Trial ID": [],
+        "Trial Title": [],
+        "Semantic Score": [],
+        "Number of Criteria": []
+    }
     # 3. All eligible trials criteria
-    all_criteria_data = []
+    criteria_patient_ids = []
+    criteria_trial_ids = []
+    criteria_trial_titles = []
+    criteria = []
 
-    # Fill the DataFrames with data from each patient
+    # Fill the columns with data from each patient
     for patient_result in all_patient_results:
         patient_id = patient_result.get("patient_id", "Unknown")
+        eligible_trials = patient_result.get("eligible_trials") or []
 
         # Patient summary
-        patient_summary_data.append({
-            "Patient ID": patient_id,
-            "Evaluation Date": patient_result.get("evaluation_date", "Unknown"),
-            "Total Trials Evaluated": patient_result.get("total_trials_evaluated", 0),
-            "Eligible Trials": len(patient_result.get("eligible_trials", [])),
-            "Ineligible Trials": len(patient_result.get("ineligible_trials", [])),
-            "Indeterminate Trials": len(patient_result.get("indeterminate_trials", []))
-        })
+        patient_summary_columns["Patient ID"].append(patient_id)
+        patient_summary_columns["Evaluation Date"].append(patient_result.get("evaluation_date", "Unknown"))
+        patient_summary_columns["Total Trials Evaluated"].append(patient_result.get("total_trials_evaluated") or 0)
+        patient_summary_columns["Eligible Trials"].append(len(eligible_trials))
+        patient_summary_columns["Ineligible Trials"].append(len(patient_result.get("ineligible_trials") or []))
+        patient_summary_columns["Indeterminate Trials"].append(len(patient_result.get("indeterminate_trials") or []))
 
         # All eligible trials for this patient
-        for trial in patient_result.get("eligible_trials", []):
+        for trial in eligible_trials:
             trial_id = trial.get("trial_id", "")
             trial_title = trial.get("trial_title", "")
+            criteria_summary = trial.get("criteria_summary") or []
+            criteria_count = len(criteria_summary)
 
-            all_eligible_trials_data.append({
-                "Patient ID": patient_id,
-                "Trial ID": trial_id,
-                "Trial Title": trial_title,
-                "Semantic Score": trial.get("semantic_score", 0),
-                "Number of Criteria": len(trial.get("criteria_summary", [])),
-                "Link": f"https://clinicaltrials.gov/study/{trial_id}"
-            })
+            eligible_trials_columns["Patient ID"].append(patient_id)
+            eligible_trials_columns["Trial ID"].append(trial_id)
+            eligible_trials_columns["Trial Title"].append(trial_title)
+            eligible_trials_columns["Semantic Score"].append(trial.get("semantic_score", 0))
+            eligible_trials_columns["Number of Criteria"].append(criteria_count)
 
             # All criteria for this trial
-            for criterion in trial.get("criteria_summary", []):
-                all_criteria_data.append({
-                    "Patient ID": patient_id,
-                    "Trial ID": trial_id,
-                    "Trial Title": trial_title,
-                    "Criterion": criterion.get("criterion", ""),
-                    "Is Met": "Yes" if criterion.get("is_met", False) else "No",
-                    "Confidence": criterion.get("confidence", "").capitalize(),
-                    "Rationale": criterion.get("rationale", ""),
-                    "Medications": ", ".join(criterion.get("medications_and_supplements", []))
-                })
+            criteria_patient_ids.extend([patient_id] * criteria_count)
+            criteria_trial_ids.extend([trial_id] * criteria_count)
+            criteria_trial_titles.extend([trial_title] * criteria_count)
+            criteria.extend(criteria_summary)
+
+    # Sort the collected columns before building the DataFrames, so rows are already in
+    # their final order: patients by ID, their trials by descending semantic score, and
+    # criteria by patient and trial (np.lexsort is stable, keeping criteria in order)
+    patient_order = np.argsort(np.asarray(patient_summary_columns["Patient ID"], dtype=str), kind="stable")
+    for name, values in patient_summary_columns.items():
+        patient_summary_columns[name] = [values[i] for i in patient_order]
+
+    trial_order = np.lexsort((
+        -np.asarray(eligible_trials_columns["Semantic Score"], dtype=float),
+        np.asarray(eligible_trials_columns["Patient ID"], dtype=str)
+    ))
+    for name, values in eligible_trials_columns.items():
+        eligible_trials_columns[name] = [values[i] for i in trial_order]
+
+    criteria_order = np.lexsort((
+        np.asarray(criteria_trial_ids, dtype=str),
+        np.asarray(criteria_patient_ids, dtype=str)
+    ))
+    criteria_patient_ids = [criteria_patient_ids[i] for i in criteria_order]
+    criteria_trial_ids = [criteria_trial_ids[i] for i in criteria_order]
+    criteria_trial_titles = [criteria_trial_titles[i] for i in criteria_order]
+    criteria = [criteria[i] for i in criteria_order]
 
     # Create DataFrames
-    patient_summary_df = pd.DataFrame(patient_summary_data)
-    all_eligible_trials_df = pd.DataFrame(all_eligible_trials_data)
-    all_criteria_df = pd.DataFrame(all_criteria_data)
-
-    # Sort DataFrames
-    if not patient_summary_df.empty:
-        patient_summary_df = patient_summary_df.sort_values("Patient ID")
-
-    if not all_eligible_trials_df.empty:
-        all_eligible_trials_df = all_eligible_trials_df.sort_values(["Patient ID", "Semantic Score"], ascending=[True, False])
-
-    if not all_criteria_df.empty:
-        all_criteria_df = all_criteria_df.sort_values(["Patient ID", "Trial ID"])
+    patient_summary_df = pd.DataFrame(patient_summary_columns, copy=False)
+    all_eligible_trials_df = pd.DataFrame(eligible_trials_columns, copy=False)
+    add_link_column(all_eligible_trials_df)
+    all_criteria_df = pd.DataFrame({
+        "Patient ID": criteria_patient_ids,
+        "Trial ID": criteria_trial_ids,
+        "Trial Title": criteria_trial_titles,
+        "Criterion": [criterion.get("criterion", "") for criterion in criteria],
+        "Is Met": ["Yes" if criterion.get("is_met", False) else "No" for criterion in criteria],
+        "Confidence": [confidence_label(criterion.get("confidence", "")) for criterion in criteria],
+        "Rationale": [criterion.get("rationale", "") for criterion in criteria],
+        "Medications": [", ".join(criterion.get("medications_and_supplements") or ()) for criterion in criteria]
+    }, copy=False)
 
     # Save to Excel
-    date_stamp = datetime.now().strftime("%Y%m%d")
+    if date_stamp is None:
+        date_stamp = _today()
     output_file = os.path.join(output_dir, f"all_patients_comprehensive_{date_stamp}.xlsx")
 
     try:
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            patient_summary_df.to_excel(writer, sheet_name='Patient Summary', index=False)
+        with open_excel_writer(output_file, constant_memory=True) as writer:
+            write_sheet(writer, patient_summary_df, 'Patient Summary')
 
             if not all_eligible_trials_df.empty:
-                all_eligible_trials_df.to_excel(writer, sheet_name='All Eligible Trials', index=False)
+                write_sheet(writer, all_eligible_trials_df, 'All Eligible Trials')
 
             if not all_criteria_df.empty:
-                all_criteria_df.to_excel(writer, sheet_name='All Eligibility Criteria', index=False)
+                write_sheet(writer, all_criteria_df, 'All Eligibility Criteria')
 
-        logger.info(f"Comprehensive Excel file saved to {output_file}")
+        logger.info("Comprehensive Excel file saved to %s", output_file)
         return output_file
-    except Exception as e:
-        logger.error(f"Error saving comprehensive Excel: {str(e)}")
+    except Exception:
+        logger.exception("Error saving comprehensive Excel")
+        return None
 
-        # Try alternative method
-        try:
-            logger.info("Attempting alternative Excel creation method...")
+def patient_sheet_name(label, patient_id, used_names):
+    """
+    Build a unique, valid Excel sheet name for one of a patient's sheets.
 
-            csv_dir = os.path.join(output_dir, "temp_csv")
-            os.makedirs(csv_dir, exist_ok=True)
+    Excel limits sheet names to 31 characters, forbids []:*?/\\ and compares them
+    case-insensitively, so long patient IDs are truncated and clashes get a ~N suffix.
 
-            summary_csv = os.path.join(csv_dir, "all_patients_summary.csv")
-            trials_csv = os.path.join(csv_dir, "all_eligible_trials.csv")
-            criteria_csv = os.path.join(csv_dir, "all_eligibility_criteria.csv")
+    Args:
+        label: Kind of sheet, e.g. "Eligible"
+        patient_id: Patient ID the sheet belongs to
+        used_names: Set of lower-cased names already in the workbook; updated in place
 
-            patient_summary_df.to_csv(summary_csv, index=False)
-            all_eligible_trials_df.to_csv(trials_csv, index=False)
-            all_criteria_df.to_csv(criteria_csv, index=False)
+    Returns:
+        Sheet name
+    """
+    base_name = re.sub(r"[\[\]:*?/\\]", "_", f"{label}_{patient_id}")[:31]
+    name = base_name
+    suffix = 1
+    while name.lower() in used_names:
+        suffix += 1
+        name = f"{base_name[:31 - len(str(suffix)) - 1]}~{suffix}"
 
-            # Now load CSVs and create Excel
-            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                pd.read_csv(summary_csv).to_excel(writer, sheet_name='Patient Summary', index=False)
-                pd.read_csv(trials_csv).to_excel(writer, sheet_name='All Eligible Trials', index=False)
-                pd.read_csv(criteria_csv).to_excel(writer, sheet_name='All Eligibility Criteria', index=False)
+    used_names.add(name.lower())
+    return name
 
-            logger.info(f"Comprehensive Excel file saved to {output_file} (alternative method)")
-            return output_file
-        except Exception as alt_e:
-            logger.error(f"Alternative method also failed: {str(alt_e)}")
-            return None
+def save_consolidated_excel(all_outputs, output_dir, date_stamp=None):
+    """
+    Save every patient's sheets and the cross-patient summary to a single Excel file,
+    in place of one file per patient plus a separate summary file.
 
-def process_single_eligibility_file(file_path, output_dir):
+    Args:
+        all_outputs: List of per-patient output dictionaries holding "formatted_results";
+            each entry's "excel_path" is set to the consolidated file
+        output_dir: Directory to save the consolidated file
+
+    Returns:
+        Path to the saved consolidated Excel file
+    """
+    if date_stamp is None:
+        date_stamp = _today()
+    output_file = os.path.join(output_dir, f"all_patients_eligibility_{date_stamp}.xlsx")
+
+    for patient_output in all_outputs:
+        patient_output["excel_path"] = output_file
+
+    summary_df, eligible_trials_df = create_summary_dataframes(all_outputs)
+
+    try:
+        with open_excel_writer(output_file, constant_memory=True) as writer:
+            write_sheet(writer, summary_df, 'Patient Summary')
+            if not eligible_trials_df.empty:
+                write_sheet(writer, eligible_trials_df, 'All Eligible Trials')
+
+            used_names = {"patient summary", "all eligible trials"}
+            for patient_output in all_outputs:
+                patient_id = patient_output.get("patient_id", "unknown")
+                dataframes = create_dataframes(patient_output["formatted_results"],
+                                               patient_output.get("unmet_criteria"))
+                for label, df in zip(("Summary", "Eligible", "Ineligible", "Details"), dataframes):
+                    if df is not None:
+                        write_sheet(writer, df, patient_sheet_name(label, patient_id, used_names))
+
+        logger.info("Consolidated Excel file for %s patients saved to %s", len(all_outputs), output_file)
+        return output_file
+    except Exception:
+        logger.exception("Error saving consolidated Excel file")
+        return None
+
+def process_single_eligibility_file(file_path, output_dir, write_excel=True, date_stamp=None):
     """
     Process a single eligibility results file.
+
+    Args:
+        file_path: Path to the eligibility results JSON file
+        output_dir: Existing directory to save output files
+        write_excel: Whether to write this patient's own Excel files; generate_output
+            turns this off when all patients go into one consolidated workbook
+        date_stamp: YYYYMMDD stamp for the file names (defaults to today);
+            generate_output passes its own so worker processes match the main process
+
+    Returns:
+        Dictionary with output paths and the formatted results
     """
     # Load the eligibility results
     eligibility_results = load_eligibility_results(file_path)
     if not eligibility_results:
-        logger.error(f"Failed to load eligibility results from {file_path}")
+        logger.error("Failed to load eligibility results from %s", file_path)
         return {"error": f"Failed to load eligibility results from {file_path}"}
 
     patient_id = eligibility_results.get("patient_id", "unknown")
+    if date_stamp is None:
+        date_stamp = _today()
+    evaluation_date = _iso_date(date_stamp)
 
     # Format results for both detailed and simple output
-    formatted_results = format_results_for_output(eligibility_results)
-    simple_results = format_simple_results(eligibility_results)
+    formatted_results, simple_results, unmet_criteria = _format_results(eligibility_results, evaluation_date)
 
     # Save JSON output (both formats)
-    json_path = save_json_output(formatted_results, output_dir)
+    json_path = save_json_output(formatted_results, output_dir, date_stamp=date_stamp)
 
     # Save simple JSON format
-    simple_json_path = os.path.join(output_dir, f"patient_{patient_id}_simple_eligibility_{datetime.now().strftime('%Y%m%d')}.json")
-    with open(simple_json_path, 'w') as f:
-        json.dump(simple_results, f, indent=2)
-    logger.info(f"Simple JSON results saved to {simple_json_path}")
-
-    # Create DataFrames for tabular output (original detailed format)
-    dataframes = create_dataframes(formatted_results)
-
-    # Create simple dataframe
-    simple_df = create_simple_dataframe(simple_results)
-
-    # Save Excel output (original format)
-    excel_path = save_excel_output(
-        dataframes,
-        output_dir,
-        patient_id
-    )
-
-    # Save simple Excel output
-    simple_excel_path = os.path.join(output_dir, f"patient_{patient_id}_simple_eligibility_{datetime.now().strftime('%Y%m%d')}.xlsx")
-    try:
-        simple_df.to_excel(simple_excel_path, sheet_name='Eligible Trials', index=False)
-        logger.info(f"Simple Excel results saved to {simple_excel_path}")
-    except Exception as e:
-        logger.error(f"Error saving simple Excel results: {str(e)}")
-        simple_excel_path = None
+    simple_json_path = os.path.join(output_dir, f"patient_{patient_id}_simple_eligibility_{date_stamp}.json")
+    write_json(simple_json_path, simple_results)
+    logger.info("Simple JSON results saved to %s", simple_json_path)
+
+    excel_path = None
+    simple_excel_path = None
+
+    if write_excel:
+        # Create DataFrames for tabular output (original detailed format)
+        dataframes = create_dataframes(formatted_results, unmet_criteria)
+
+        # Create simple dataframe
+        simple_df = create_simple_dataframe(simple_results)
+
+        # Save Excel output (original format), with the simple format as an extra sheet
+        # of the same workbook
+        excel_path = save_excel_output(
+            dataframes,
+            output_dir,
+            patient_id,
+            simple_df=simple_df,
+            date_stamp=date_stamp
+        )
+        simple_excel_path = excel_path
 
     # Return output paths and formatted results
     return {
@@ -670,25 +985,67 @@ def process_single_eligibility_file(file_path, output_dir):
         "simple_json_path": simple_json_path,
         "simple_excel_path": simple_excel_path,
         "formatted_results": formatted_results,  # Include the formatted results for consolidation
-        "simple_results": simple_results  # Include simple results
+        "simple_results": simple_results,  # Include simple results
+        "unmet_criteria": unmet_criteria  # Ineligible trial bookkeeping for create_dataframes
     }
 
-def generate_output(eligibility_results_path, output_dir):
+def generate_output(eligibility_results_path, output_dir, max_workers=None, consolidated=None):
     """
     Generate JSON and Excel output from eligibility results.
+
+    Args:
+        eligibility_results_path: Path to an eligibility results JSON file or a directory of them
+        output_dir: Directory to save output files (created if missing)
+        max_workers: Number of worker processes for a directory of files
+            (defaults to the CPU count; 1 processes the files sequentially)
+        consolidated: For a directory, write all patients' sheets and the summary to one
+            Excel file instead of one file per patient (defaults to True for directories)
     """
+    # Create the output directory once; the per-file helpers assume it exists
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Take the date once per run and pass it to every writer, including worker processes,
+    # so all files from this run share one stamp even if it crosses midnight
+    date_stamp = _today()
+
     # Handle both single file and directory paths
     if os.path.isdir(eligibility_results_path):
-        # Process all JSON files in the directory
-        json_files = glob.glob(os.path.join(eligibility_results_path, "*.json"))
-        logger.info(f"Found {len(json_files)} JSON files in {eligibility_results_path}")
+        # Process all JSON files in the directory, skipping hidden files
+        with os.scandir(eligibility_results_path) as entries:
+            json_files = [
+                entry.path for entry in entries
+                if entry.name.endswith(".json") and not entry.name.startswith(".") and entry.is_file()
+            ]
+        # scandir yields entries in arbitrary order; sort so consolidated outputs are reproducible
+        json_files.sort()
+        logger.info("Found %s JSON files in %s", len(json_files), eligibility_results_path)
 
         all_outputs = []
         all_formatted_results = []
         all_simple_results = []
 
-        for json_file in json_files:
-            result = process_single_eligibility_file(json_file, output_dir)
+        if consolidated is None:
+            consolidated = True
+
+        # Each patient file is independent, so process them in parallel
+        process_file = partial(process_single_eligibility_file, output_dir=output_dir,
+                               write_excel=not consolidated, date_stamp=date_stamp)
+        if max_workers == 1 or len(json_files) <= 1:
+            results = [process_file(json_file) for json_file in json_files]
+        else:
+            # Collect results as workers finish, keeping them in file order; a file whose
+            # worker raised is logged and skipped instead of aborting the whole directory
+            results = [None] * len(json_files)
+            with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+                futures = {executor.submit(process_file, json_file): i for i, json_file in enumerate(json_files)}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        results[i] = future.result()
+                    except Exception as e:
+                        logger.error("Error processing %s: %s", json_files[i], e)
+
+        for result in results:
             if result and "error" not in result:
                 all_outputs.append(result)
                 # Store formatted results for consolidated output
@@ -697,44 +1054,38 @@ def generate_output(eligibility_results_path, output_dir):
                 if "simple_results" in result:
                     all_simple_results.append(result["simple_results"])
 
+        # Write every patient and the summary into one workbook with a single writer
+        consolidated_excel = save_consolidated_excel(all_outputs, output_dir, date_stamp) if consolidated and all_outputs else None
+
         # If we have multiple patients, create consolidated outputs
         if len(all_formatted_results) > 1:
             # Create consolidated JSON with all patient data (original format)
-            consolidated_json = create_consolidated_json(all_formatted_results, output_dir)
+            consolidated_json = create_consolidated_json(all_formatted_results, output_dir, date_stamp)
 
             # Create comprehensive Excel with all patient data (original format)
-            comprehensive_excel = create_comprehensive_excel(all_formatted_results, output_dir)
+            comprehensive_excel = create_comprehensive_excel(all_formatted_results, output_dir, date_stamp)
 
             # Create consolidated simple format
             simple_consolidated = {
                 "patients": all_simple_results
             }
-            simple_consolidated_path = os.path.join(output_dir, f"all_patients_simple_{datetime.now().strftime('%Y%m%d')}.json")
-            with open(simple_consolidated_path, 'w') as f:
-                json.dump(simple_consolidated, f, indent=2)
-
-            # Create simple Excel with all patients
-            simple_rows = []
-            for patient in all_simple_results:
-                patient_id = patient.get("patientId", "unknown")
-                for trial in patient.get("eligibleTrials", []):
-                    row = {
-                        "Patient ID": patient_id,
-                        "Trial ID": trial.get("trialId", ""),
-                        "Trial Name": trial.get("trialName", ""),
-                        "Eligibility Criteria Met": ", ".join(trial.get("eligibilityCriteriaMet", []))
-                    }
-                    simple_rows.append(row)
-
-            if simple_rows:
-                simple_all_df = pd.DataFrame(simple_rows)
-                simple_all_excel = os.path.join(output_dir, f"all_patients_simple_{datetime.now().strftime('%Y%m%d')}.xlsx")
-                simple_all_df.to_excel(simple_all_excel, sheet_name='Eligible Trials', index=False)
+            simple_consolidated_path = os.path.join(output_dir, f"all_patients_simple_{date_stamp}.json")
+            write_json(simple_consolidated_path, simple_consolidated)
+
+            # Create simple Excel with all patients from the same records as the JSON
+            simple_all_df = create_simple_dataframe_all(all_simple_results)
+            if not simple_all_df.empty:
+                simple_all_excel = os.path.join(output_dir, f"all_patients_simple_{date_stamp}.xlsx")
+                with open_excel_writer(simple_all_excel, constant_memory=True) as writer:
+                    write_sheet(writer, simple_all_df, 'Eligible Trials')
             else:
                 simple_all_excel = None
 
-            # Also create the existing summary spreadsheet for backward compatibility
-            summary_file = create_summary_spreadsheet(all_outputs, output_dir)
+            # The consolidated workbook already holds the summary; otherwise write it separately
+            if consolidated:
+                summary_file = consolidated_excel
+            else:
+                summary_file = create_summary_spreadsheet(all_outputs, output_dir, date_stamp=date_stamp)
 
             return {
                 "individual_outputs": all_outputs,
@@ -742,7 +1093,8 @@ def generate_output(eligibility_results_path, output_dir):
                 "consolidated_json": consolidated_json,
                 "comprehensive_excel": comprehensive_excel,
                 "simple_consolidated_json": simple_consolidated_path,
-                "simple_consolidated_excel": simple_all_excel
+                "simple_consolidated_excel": simple_all_excel,
+                "consolidated_excel": consolidated_excel
             }
         elif len(all_outputs) == 1:
             return all_outputs[0]
@@ -752,70 +1104,143 @@ def generate_output(eligibility_results_path, output_dir):
         # Process single file
         return process_single_eligibility_file(eligibility_results_path, output_dir)
 
-def create_summary_spreadsheet(output_files, output_dir):
+def _load_patient_results(patient_output):
     """
-    Create a summary spreadsheet with data from all patients.
+    Return a patient's formatted results, reloading them from the saved JSON file when
+    they are not held in memory.
+
+    Args:
+        patient_output: Dictionary with output file info for one patient
+
+    Returns:
+        Formatted results dictionary, or None if they are unavailable
+    """
+    patient_results = patient_output.get("formatted_results")
+    json_path = patient_output.get("json_path")
+    if patient_results is None and json_path:
+        try:
+            patient_results = read_json(json_path)
+        except FileNotFoundError:
+            logger.warning("Results file for patient %s not found: %s",
+                           patient_output.get("patient_id", "Unknown"), json_path)
+    return patient_results
+
+def create_summary_dataframes(output_files):
+    """
+    Create the cross-patient summary DataFrames.
+
+    Each entry's in-memory "formatted_results" is used when present; entries without it
+    are loaded from their saved "json_path" instead.
 
     Args:
         output_files: List of dictionaries with output file info
-        output_dir: Directory to save the summary file
 
     Returns:
-        Path to the saved summary Excel file
+        Tuple of DataFrames (summary_df, eligible_trials_df)
     """
-    logger.info("Creating multi-patient summary spreadsheet")
+    import pandas as pd
+
+    # Prepare summary data, one list per column
+    summary_columns = {
+        "Patient ID": [],
+        "Evaluation Date": [],
+        "Total Trials Evaluated": [],
+        "Eligible Trials": [],
+        "Ineligible Trials": [],
+        "Excel Report": []
+    }
+    eligible_columns = {
+        "Patient ID": [],
+        "Trial ID": [],
+        "Trial Title": [],
+        "Semantic Score": []
+    }
 
-    # Prepare summary data
-    summary_data = []
-    eligible_trials_all = []
+    # Prefer the formatted results kept in memory; saved JSON files are only reloaded for
+    # entries without them, concurrently when there are several since the reads are I/O bound
+    missing_count = sum(1 for patient_output in output_files if patient_output.get("formatted_results") is None)
+    if missing_count > 1:
+        with ThreadPoolExecutor(max_workers=min(16, missing_count)) as executor:
+            loaded_results = list(executor.map(_load_patient_results, output_files))
+    else:
+        loaded_results = [_load_patient_results(patient_output) for patient_output in output_files]
 
-    for patient_output in output_files:
+    for patient_output, patient_results in zip(output_files, loaded_results):
         patient_id = patient_output.get("patient_id", "Unknown")
-        json_path = patient_output.get("json_path")
 
-        if json_path and os.path.exists(json_path):
-            # Load formatted results for this patient
-            with open(json_path, 'r') as f:
-                patient_results = json.load(f)
+        if patient_results is not None:
+            eligible_trials = patient_results.get("eligible_trials") or []
 
             # Add to summary
-            summary_data.append({
-                "Patient ID": patient_id,
-                "Evaluation Date": patient_results.get("evaluation_date", "Unknown"),
-                "Total Trials Evaluated": patient_results.get("total_trials_evaluated", 0),
-                "Eligible Trials": len(patient_results.get("eligible_trials", [])),
-                "Ineligible Trials": len(patient_results.get("ineligible_trials", [])),
-                "Excel Report": patient_output.get("excel_path", "Not available")
-            })
+            summary_columns["Patient ID"].append(patient_id)
+            summary_columns["Evaluation Date"].append(patient_results.get("evaluation_date", "Unknown"))
+            summary_columns["Total Trials Evaluated"].append(patient_results.get("total_trials_evaluated") or 0)
+            summary_columns["Eligible Trials"].append(len(eligible_trials))
+            summary_columns["Ineligible Trials"].append(len(patient_results.get("ineligible_trials") or []))
+            summary_columns["Excel Report"].append(patient_output.get("excel_path", "Not available"))
+
+            # Add eligible trials for this patient to the consolidated columns
+            for trial in eligible_trials:
+                eligible_columns["Patient ID"].append(patient_id)
+                eligible_columns["Trial ID"].append(trial.get("trial_id", ""))
+                eligible_columns["Trial Title"].append(trial.get("trial_title", ""))
+                eligible_columns["Semantic Score"].append(trial.get("semantic_score", 0))
+
+    # Create DataFrames; trial counts fit comfortably in 32-bit integers
+    summary_df = pd.DataFrame(summary_columns, copy=False).astype(SUMMARY_COUNT_DTYPES)
+    eligible_trials_df = pd.DataFrame(eligible_columns, copy=False)
+    add_link_column(eligible_trials_df)
+
+    return summary_df, eligible_trials_df
+
+def create_summary_spreadsheet(output_files, output_dir, date_stamp=None, use_csv=None):
+    """
+    Create a summary spreadsheet with data from all patients.
 
-            # Add eligible trials for this patient to the consolidated list
-            for trial in patient_results.get("eligible_trials", []):
-                eligible_trials_all.append({
-                    "Patient ID": patient_id,
-                    "Trial ID": trial.get("trial_id", ""),
-                    "Trial Title": trial.get("trial_title", ""),
-                    "Semantic Score": trial.get("semantic_score", 0),
-                    "Link": f"https://clinicaltrials.gov/study/{trial.get('trial_id', '')}"
-                })
+    Args:
+        output_files: List of dictionaries with output file info
+        output_dir: Directory to save the summary file
+        date_stamp: YYYYMMDD stamp for the file name (defaults to today)
+        use_csv: Write all_patients_summary_DATE.csv and all_patients_eligible_trials_DATE.csv
+            instead of an Excel workbook, which is much faster for large runs
+            (defaults to the FAST_SUMMARY environment variable)
 
-    # Create DataFrames
-    summary_df = pd.DataFrame(summary_data)
-    eligible_trials_df = pd.DataFrame(eligible_trials_all)
+    Returns:
+        Path to the saved summary file (the patient summary CSV when use_csv is set),
+        or None if there is no patient data or saving fails
+    """
+    logger.info("Creating multi-patient summary spreadsheet")
 
-    # Save to Excel
-    date_stamp = datetime.now().strftime("%Y%m%d")
-    summary_file = os.path.join(output_dir, f"all_patients_summary_{date_stamp}.xlsx")
+    summary_df, eligible_trials_df = create_summary_dataframes(output_files)
+    if summary_df.empty:
+        logger.info("No patient results to summarize; skipping summary spreadsheet")
+        return None
+
+    if date_stamp is None:
+        date_stamp = _today()
+    if use_csv is None:
+        use_csv = FAST_SUMMARY
 
     try:
-        with pd.ExcelWriter(summary_file, engine='openpyxl') as writer:
-            summary_df.to_excel(writer, sheet_name='Patient Summary', index=False)
+        if use_csv:
+            summary_file = os.path.join(output_dir, f"all_patients_summary_{date_stamp}.csv")
+            summary_df.to_csv(summary_file, index=False)
             if not eligible_trials_df.empty:
-                eligible_trials_df.to_excel(writer, sheet_name='All Eligible Trials', index=False)
-
-        logger.info(f"Multi-patient summary saved to {summary_file}")
+                eligible_trials_df.to_csv(
+                    os.path.join(output_dir, f"all_patients_eligible_trials_{date_stamp}.csv"), index=False
+                )
+        else:
+            # Save to Excel; rows are streamed so neither engine holds the whole workbook in memory
+            summary_file = os.path.join(output_dir, f"all_patients_summary_{date_stamp}.xlsx")
+            with open_excel_writer(summary_file, constant_memory=True) as writer:
+                write_sheet(writer, summary_df, 'Patient Summary')
+                if not eligible_trials_df.empty:
+                    write_sheet(writer, eligible_trials_df, 'All Eligible Trials')
+
+        logger.info("Multi-patient summary saved to %s", summary_file)
         return summary_file
-    except Exception as e:
-        logger.error(f"Error saving summary file: {str(e)}")
+    except Exception:
+        logger.exception("Error saving summary file")
         return None
 
 def main():
@@ -830,39 +1255,43 @@ def main():
     parser.add_argument("--output-dir", "-o", type=str, default="../data/outputs",
                       help="Directory to save output files")
 
+    parser.add_argument("--consolidated", action=argparse.BooleanOptionalAction, default=None,
+                      help="Write all patients to one Excel file instead of one per patient "
+                           "(default for a directory input)")
+
     args = parser.parse_args()
 
     # Ensure input exists
     if not os.path.exists(args.input):
-        logger.error(f"Input not found: {args.input}")
+        logger.error("Input not found: %s", args.input)
         sys.exit(1)
 
     # Generate outputs
-    results = generate_output(args.input, args.output_dir)
+    results = generate_output(args.input, args.output_dir, consolidated=args.consolidated)
 
     # Print results
     if "error" in results:
-        logger.error(results["error"])
+        logger.error("%s", results["error"])
     elif "individual_outputs" in results:
         # Multi-patient results
-        logger.info(f"Output generation completed successfully for {len(results['individual_outputs'])} patients.")
+        logger.info("Output generation completed successfully for %s patients.", len(results['individual_outputs']))
 
         # Log summary spreadsheet
         if "summary_spreadsheet" in results:
-            logger.info(f"Summary spreadsheet: {results.get('summary_spreadsheet', 'None')}")
+            logger.info("Summary spreadsheet: %s", results.get('summary_spreadsheet', 'None'))
 
         # Log consolidated JSON
         if "consolidated_json" in results:
-            logger.info(f"Consolidated JSON with all patient data: {results.get('consolidated_json', 'None')}")
+            logger.info("Consolidated JSON with all patient data: %s", results.get('consolidated_json', 'None'))
 
         # Log comprehensive Excel
         if "comprehensive_excel" in results:
-            logger.info(f"Comprehensive Excel with all patient data: {results.get('comprehensive_excel', 'None')}")
+            logger.info("Comprehensive Excel with all patient data: %s", results.get('comprehensive_excel', 'None'))
     else:
         # Single patient results
         logger.info("Output generation completed successfully:")
-        logger.info(f"JSON output: {results.get('json_path', 'None')}")
-        logger.info(f"Excel output: {results.get('excel_path', 'None')}")
+        logger.info("JSON output: %s", results.get('json_path', 'None'))
+        logger.info("Excel output: %s", results.get('excel_path', 'None'))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
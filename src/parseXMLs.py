@@ -1,10 +1,27 @@
 import os
-import xml.etree.ElementTree as ET
 import json
+from concurrent.futures import ProcessPoolExecutor
+import heapq
 import pandas as pd
 from datetime import datetime
+from functools import partial
 import re
 
+# lxml parses C-CDA documents several times faster than the standard library and its
+# elements support the same find/findall/get API; fall back to ElementTree without it
+try:
+    from lxml import etree as ET
+    _LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _LXML = False
+
+# orjson is optional; fall back to the standard library serializer without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Define namespaces used in C-CDA
 namespaces = {
     'cda': 'urn:hl7-org:v3',
@@ -12,36 +29,210 @@ namespaces = {
     'sdtc': 'urn:hl7-org:sdtc'
 }
 
+# Short alias for the prefix map handed to XPath expressions
+NS = namespaces
+
+# Namespace-qualified (Clark notation) tags and paths for find/findall, built once
+# instead of formatting the namespace into every lookup
+CDA = '{%s}' % NS['cda']
+TAG_ACT = CDA + 'act'
+TAG_ADDR = CDA + 'addr'
+TAG_ADMINISTRATIVE_GENDER_CODE = CDA + 'administrativeGenderCode'
+TAG_BIRTH_TIME = CDA + 'birthTime'
+TAG_CITY = CDA + 'city'
+TAG_CODE = CDA + 'code'
+TAG_COMPONENT = CDA + 'component'
+TAG_CONSUMABLE = CDA + 'consumable'
+TAG_CONTENT = CDA + 'content'
+TAG_DOSE_QUANTITY = CDA + 'doseQuantity'
+TAG_EFFECTIVE_TIME = CDA + 'effectiveTime'
+TAG_ENTRY = CDA + 'entry'
+TAG_ENTRY_RELATIONSHIP = CDA + 'entryRelationship'
+TAG_ETHNIC_GROUP_CODE = CDA + 'ethnicGroupCode'
+TAG_ID = CDA + 'id'
+TAG_ITEM = CDA + 'item'
+TAG_LOW = CDA + 'low'
+TAG_MANUFACTURED_MATERIAL = CDA + 'manufacturedMaterial'
+TAG_MANUFACTURED_PRODUCT = CDA + 'manufacturedProduct'
+TAG_OBSERVATION = CDA + 'observation'
+TAG_OBSERVATION_RANGE = CDA + 'observationRange'
+TAG_ORGANIZER = CDA + 'organizer'
+TAG_PARAGRAPH = CDA + 'paragraph'
+TAG_PATIENT = CDA + 'patient'
+TAG_PATIENT_ROLE = CDA + 'patientRole'
+TAG_POSTAL_CODE = CDA + 'postalCode'
+TAG_PROCEDURE = CDA + 'procedure'
+TAG_RACE_CODE = CDA + 'raceCode'
+TAG_RECORD_TARGET = CDA + 'recordTarget'
+TAG_REFERENCE_RANGE = CDA + 'referenceRange'
+TAG_SECTION = CDA + 'section'
+TAG_STATE = CDA + 'state'
+TAG_STATUS_CODE = CDA + 'statusCode'
+TAG_STRUCTURED_BODY = CDA + 'structuredBody'
+TAG_SUBSTANCE_ADMINISTRATION = CDA + 'substanceAdministration'
+TAG_TEXT = CDA + 'text'
+TAG_TITLE = CDA + 'title'
+TAG_TRANSLATION = CDA + 'translation'
+TAG_VALUE = CDA + 'value'
+
+# Problem observations sit inside a Problem Concern Act
+PATH_PROBLEM_OBSERVATION = TAG_ACT + '/' + TAG_ENTRY_RELATIONSHIP + '/' + TAG_OBSERVATION
+PATH_MANUFACTURED_PRODUCT = TAG_CONSUMABLE + '/' + TAG_MANUFACTURED_PRODUCT
+# Result and vital sign observations sit inside an entry's organizer (panel)
+PATH_ENTRY_ORGANIZER = TAG_ENTRY + '/' + TAG_ORGANIZER
+PATH_COMPONENT_OBSERVATION = TAG_COMPONENT + '/' + TAG_OBSERVATION
+PATH_PANEL_OBSERVATION = PATH_ENTRY_ORGANIZER + '/' + PATH_COMPONENT_OBSERVATION
+
+# Descendant searches where the element's depth is not fixed
+PATH_ANY_COMPONENT = './/' + TAG_COMPONENT
+PATH_ANY_EFFECTIVE_TIME = './/' + TAG_EFFECTIVE_TIME
+
+# Common clinical note section codes, in the order their notes are reported
+NOTE_SECTION_CODES = (
+    "11488-4",  # Consultation Note
+    "18842-5",  # Discharge Summary
+    "28570-0",  # Procedure Note
+    "34117-2",  # History and Physical Note
+    "34839-1",  # Progress Note
+    "51845-6",  # Assessment and Plan
+    "51847-2",  # Evaluation Note
+    "47039-3",  # Hospital Admission Diagnosis
+    "8648-8",   # Hospital Course
+    "10184-0"   # Surgical Operation Note
+)
+
+# Note text clean-up patterns, compiled once rather than on every note
+_WS_RE = re.compile(r'\s+')
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# lxml parser options shared by every C-CDA parse: never load DTDs, fetch from the
+# network or expand entities (C-CDA needs none of them, and untrusted files could abuse
+# them), and drop whitespace-only text, comments and processing instructions, which the
+# extractors never read
+_PARSER_OPTIONS = {
+    'resolve_entities': False,
+    'load_dtd': False,
+    'no_network': True,
+    'remove_blank_text': True,
+    'remove_comments': True,
+    'remove_pis': True
+}
+
+# Body sections are looked up by code many times per document, so on lxml trees the
+# lookup is a compiled XPath evaluated in C rather than a Python walk over the body
+if _LXML:
+    _section_by_code_xpath = ET.XPath(
+        "cda:component/cda:structuredBody//cda:component/cda:section[cda:code/@code = $code]",
+        namespaces={'cda': NS['cda']}
+    )
+
+def _fmt_date(value):
+    """Format an HL7 timestamp (YYYYMMDD...) as YYYY-MM-DD, leaving shorter values as-is"""
+    if value and len(value) >= 8:
+        return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+    return value
+
+def _reference_date():
+    """Return today's (year, month, day), the date patient ages are computed against"""
+    today = datetime.now()
+    return today.year, today.month, today.day
+
 def register_namespaces():
-    """Register namespaces for better XPath handling"""
+    """
+    Register the C-CDA namespace prefixes for serializing elements with ElementTree.
+
+    Parsing does not depend on this: every lookup uses the namespace-qualified TAG_*
+    constants or the NS prefix map.
+    """
     for prefix, uri in namespaces.items():
         ET.register_namespace(prefix, uri)
 
-def parse_ccda_file(file_path):
+def parse_ccda_file(file_path, reference_date=None):
     """
     Parse a C-CDA XML file and extract patient information relevant for clinical trial matching.
 
+    The file is streamed with iterparse: the recordTarget header and each top-level body
+    section are passed to their extractors as soon as they are complete and then cleared,
+    so memory is bounded by the largest section rather than the whole document.
+
     Args:
         file_path: Path to the C-CDA XML file
+        reference_date: (year, month, day) the patient's age is computed against
+            (defaults to today)
 
     Returns:
         dict: Dictionary containing patient information
     """
     try:
-        # Parse the XML file
-        tree = ET.parse(file_path)
-        root = tree.getroot()
+        patient_id = "unknown"
+        demographics = {}
+        record_target_seen = False
+        section_results = {key: [] for key, _ in _SECTION_EXTRACTORS.values()}
+        seen_section_codes = set()
+        notes_by_code = {}
+        narrative_notes = []
+        section_depth = 0
+
+        for event, element in _iterparse_ccda(file_path):
+            tag = element.tag
+            if tag == TAG_SECTION:
+                # Track nesting so a section is only handled once it and any nested
+                # sections are complete
+                if event == "start":
+                    section_depth += 1
+                    continue
+                section_depth -= 1
+                if section_depth:
+                    continue
+
+                # Visit the section and its nested sections in document order, so the
+                # first section with a given code wins as in find_section_by_code
+                for section in element.iter(TAG_SECTION):
+                    code_element = section.find(TAG_CODE)
+                    section_code = code_element.get('code') if code_element is not None else None
+
+                    if section_code not in seen_section_codes:
+                        seen_section_codes.add(section_code)
+                        if section_code in _SECTION_EXTRACTORS:
+                            key, extractor = _SECTION_EXTRACTORS[section_code]
+                            section_results[key] = extractor(section)
+                        elif section_code in NOTE_SECTION_CODES:
+                            try:
+                                note = extract_note_from_section(section, section_code)
+                                if note is not None:
+                                    notes_by_code[section_code] = note
+                            except Exception as e:
+                                print(f"Error extracting clinical notes: {str(e)}")
+
+                    # Untyped narrative notes are only reported when no note section exists
+                    if not notes_by_code:
+                        try:
+                            note = extract_narrative_from_section(section)
+                            if note is not None:
+                                narrative_notes.append(note)
+                        except Exception as e:
+                            print(f"Error extracting clinical notes: {str(e)}")
+
+                element.clear()
+            elif tag == TAG_RECORD_TARGET and event == "end" and not record_target_seen:
+                record_target_seen = True
+                patient_id = extract_patient_id_from_record_target(element)
+                demographics = extract_demographics_from_record_target(element, reference_date)
+                element.clear()
+
+        # Report note sections in NOTE_SECTION_CODES order, as extract_clinical_notes does
+        clinical_notes = [notes_by_code[code] for code in NOTE_SECTION_CODES if code in notes_by_code]
 
         # Extract patient data
         patient_data = {
-            "patientId": extract_patient_id(root),
-            "demographics": extract_demographics(root),
-            "conditions": extract_conditions(root),
-            "medications": extract_medications(root),
-            "labs": extract_lab_results(root),
-            "procedures": extract_procedures(root),
-            "vitals": extract_vitals(root),
-            "clinicalNotes": extract_clinical_notes(root)  # Add clinical notes extraction
+            "patientId": patient_id,
+            "demographics": demographics,
+            "conditions": section_results["conditions"],
+            "medications": section_results["medications"],
+            "labs": section_results["labs"],
+            "procedures": section_results["procedures"],
+            "vitals": section_results["vitals"],
+            "clinicalNotes": clinical_notes or narrative_notes
         }
 
         return patient_data
@@ -50,15 +241,37 @@ def parse_ccda_file(file_path):
         print(f"Error parsing {file_path}: {str(e)}")
         return None
 
+def _iterparse_ccda(file_path):
+    """
+    Stream start and end events for the recordTarget and section elements of a C-CDA file.
+
+    lxml filters the events by tag in C and parses with _PARSER_OPTIONS, dropping the
+    comments and processing instructions ElementTree never reports as children;
+    ElementTree yields events for every element and the caller skips the rest.
+
+    Args:
+        file_path: Path to the C-CDA XML file
+
+    Returns:
+        Iterator of (event, element) tuples
+    """
+    if _LXML:
+        return ET.iterparse(file_path, events=("start", "end"), tag=(TAG_RECORD_TARGET, TAG_SECTION),
+                            **_PARSER_OPTIONS)
+    return ET.iterparse(file_path, events=("start", "end"))
+
 def extract_patient_id(root):
     """Extract patient ID from C-CDA"""
+    return extract_patient_id_from_record_target(root.find(TAG_RECORD_TARGET))
+
+def extract_patient_id_from_record_target(record_target):
+    """Extract patient ID from a C-CDA recordTarget element"""
     try:
         # Try to find the patient ID in the recordTarget element
-        record_target = root.find('.//{{{0}}}recordTarget'.format(namespaces['cda']))
         if record_target is not None:
-            patient_role = record_target.find('.//{{{0}}}patientRole'.format(namespaces['cda']))
+            patient_role = record_target.find(TAG_PATIENT_ROLE)
             if patient_role is not None:
-                id_element = patient_role.find('.//{{{0}}}id'.format(namespaces['cda']))
+                id_element = patient_role.find(TAG_ID)
                 if id_element is not None:
                     return id_element.get('extension', 'unknown')
         return "unknown"
@@ -66,32 +279,35 @@ def extract_patient_id(root):
         print(f"Error extracting patient ID: {str(e)}")
         return "unknown"
 
-def extract_demographics(root):
-    """Extract patient demographics from C-CDA"""
+def extract_demographics(root, reference_date=None):
+    """Extract patient demographics from C-CDA, with ages as of reference_date (default today)"""
+    return extract_demographics_from_record_target(root.find(TAG_RECORD_TARGET), reference_date)
+
+def extract_demographics_from_record_target(record_target, reference_date=None):
+    """Extract patient demographics from a C-CDA recordTarget element, with ages as of
+    reference_date, a (year, month, day) tuple that defaults to today"""
     demographics = {}
 
     try:
-        # Get recordTarget element
-        record_target = root.find('.//{{{0}}}recordTarget'.format(namespaces['cda']))
         if record_target is None:
             return demographics
 
         # Get patient element
-        patient_role = record_target.find('.//{{{0}}}patientRole'.format(namespaces['cda']))
+        patient_role = record_target.find(TAG_PATIENT_ROLE)
         if patient_role is None:
             return demographics
 
-        patient_element = patient_role.find('.//{{{0}}}patient'.format(namespaces['cda']))
+        patient_element = patient_role.find(TAG_PATIENT)
         if patient_element is None:
             return demographics
 
         # Extract gender
-        gender_element = patient_element.find('.//{{{0}}}administrativeGenderCode'.format(namespaces['cda']))
+        gender_element = patient_element.find(TAG_ADMINISTRATIVE_GENDER_CODE)
         if gender_element is not None:
             demographics['gender'] = gender_element.get('code')
 
         # Extract birth date
-        birth_time = patient_element.find('.//{{{0}}}birthTime'.format(namespaces['cda']))
+        birth_time = patient_element.find(TAG_BIRTH_TIME)
         if birth_time is not None:
             birth_date = birth_time.get('value')
             if birth_date:
@@ -101,36 +317,37 @@ def extract_demographics(root):
                     year = int(birth_date[:4])
                     month = int(birth_date[4:6])
                     day = int(birth_date[6:8])
-                    birth_date_obj = datetime(year, month, day)
-                    today = datetime.now()
-                    age = today.year - birth_date_obj.year - ((today.month, today.day) < (birth_date_obj.month, birth_date_obj.day))
+                    # Reject impossible calendar dates before computing the age
+                    datetime(year, month, day)
+                    today_year, today_month, today_day = reference_date or _reference_date()
+                    age = today_year - year - ((today_month, today_day) < (month, day))
                     demographics['age'] = age
                     demographics['birthDate'] = f"{year}-{month:02d}-{day:02d}"
                 except:
                     demographics['birthDate'] = birth_date
 
         # Extract race
-        race_element = patient_element.find('.//{{{0}}}raceCode'.format(namespaces['cda']))
+        race_element = patient_element.find(TAG_RACE_CODE)
         if race_element is not None:
             demographics['race'] = race_element.get('displayName', race_element.get('code'))
 
         # Extract ethnicity
-        ethnicity_element = patient_element.find('.//{{{0}}}ethnicGroupCode'.format(namespaces['cda']))
+        ethnicity_element = patient_element.find(TAG_ETHNIC_GROUP_CODE)
         if ethnicity_element is not None:
             demographics['ethnicity'] = ethnicity_element.get('displayName', ethnicity_element.get('code'))
 
         # Extract address
-        address_element = patient_role.find('.//{{{0}}}addr'.format(namespaces['cda']))
+        address_element = patient_role.find(TAG_ADDR)
         if address_element is not None:
-            city = address_element.find('.//{{{0}}}city'.format(namespaces['cda']))
+            city = address_element.find(TAG_CITY)
             if city is not None and city.text:
                 demographics['city'] = city.text
 
-            state = address_element.find('.//{{{0}}}state'.format(namespaces['cda']))
+            state = address_element.find(TAG_STATE)
             if state is not None and state.text:
                 demographics['state'] = state.text
 
-            zip_code = address_element.find('.//{{{0}}}postalCode'.format(namespaces['cda']))
+            zip_code = address_element.find(TAG_POSTAL_CODE)
             if zip_code is not None and zip_code.text:
                 demographics['zipCode'] = zip_code.text
 
@@ -142,20 +359,25 @@ def extract_demographics(root):
 def find_section_by_code(root, section_code):
     """Find a section in the document by its code attribute"""
     try:
+        # lxml elements have an xpath method; ElementTree elements fall through to the walk
+        if _LXML and hasattr(root, 'xpath'):
+            sections = _section_by_code_xpath(root, code=section_code)
+            return sections[0] if sections else None
+
         # Navigate to component/structuredBody
-        component = root.find('.//{{{0}}}component'.format(namespaces['cda']))
+        component = root.find(TAG_COMPONENT)
         if component is None:
             return None
 
-        structured_body = component.find('.//{{{0}}}structuredBody'.format(namespaces['cda']))
+        structured_body = component.find(TAG_STRUCTURED_BODY)
         if structured_body is None:
             return None
 
         # Look through all components to find the section with matching code
-        for comp in structured_body.findall('.//{{{0}}}component'.format(namespaces['cda'])):
-            section = comp.find('.//{{{0}}}section'.format(namespaces['cda']))
+        for comp in structured_body.findall(PATH_ANY_COMPONENT):
+            section = comp.find(TAG_SECTION)
             if section is not None:
-                code_element = section.find('.//{{{0}}}code'.format(namespaces['cda']))
+                code_element = section.find(TAG_CODE)
                 if code_element is not None and code_element.get('code') == section_code:
                     return section
 
@@ -164,58 +386,83 @@ def find_section_by_code(root, section_code):
         print(f"Error finding section {section_code}: {str(e)}")
         return None
 
+def build_section_index(root):
+    """
+    Index the document's body sections by code in a single walk.
+
+    Args:
+        root: Root element of the C-CDA document
+
+    Returns:
+        dict: Section code -> first section element with that code, as find_section_by_code
+    """
+    sections_by_code = {}
+    component = root.find(TAG_COMPONENT)
+    if component is None:
+        return sections_by_code
+
+    structured_body = component.find(TAG_STRUCTURED_BODY)
+    if structured_body is None:
+        return sections_by_code
+
+    for comp in structured_body.iterfind(PATH_ANY_COMPONENT):
+        section = comp.find(TAG_SECTION)
+        if section is not None:
+            code_element = section.find(TAG_CODE)
+            if code_element is not None:
+                sections_by_code.setdefault(code_element.get('code'), section)
+
+    return sections_by_code
+
 def extract_conditions(root):
     """Extract patient conditions/problems from C-CDA"""
+    # Find the problem section (code 11450-4)
+    return extract_conditions_from_section(find_section_by_code(root, "11450-4"))
+
+def extract_conditions_from_section(problem_section):
+    """Extract patient conditions/problems from the C-CDA problem section"""
     conditions = []
 
     try:
-        # Find the problem section (code 11450-4)
-        problem_section = find_section_by_code(root, "11450-4")
-
         if problem_section is not None:
             # Get all entries in the problem section
-            entries = problem_section.findall('.//{{{0}}}entry'.format(namespaces['cda']))
+            entries = problem_section.findall(TAG_ENTRY)
 
             for entry in entries:
                 condition = {}
 
                 # Get observation (problem)
-                observation = entry.find('.//{{{0}}}observation'.format(namespaces['cda']))
+                observation = entry.find(PATH_PROBLEM_OBSERVATION)
                 if observation is None:
                     continue
 
                 # Extract code
-                code_element = observation.find('.//{{{0}}}code'.format(namespaces['cda']))
+                code_element = observation.find(TAG_CODE)
                 if code_element is not None:
                     condition['code'] = code_element.get('code')
                     condition['codeSystem'] = code_element.get('codeSystem')
 
                 # Extract value (diagnosis)
-                value_element = observation.find('.//{{{0}}}value'.format(namespaces['cda']))
+                value_element = observation.find(TAG_VALUE)
                 if value_element is not None:
                     condition['name'] = value_element.get('displayName', '')
                     if not condition['name']:
                         # Try to find a translation
-                        translation = value_element.find('.//{{{0}}}translation'.format(namespaces['cda']))
+                        translation = value_element.find(TAG_TRANSLATION)
                         if translation is not None:
                             condition['name'] = translation.get('displayName', '')
 
                 # Extract status
-                status_element = observation.find('.//{{{0}}}statusCode'.format(namespaces['cda']))
+                status_element = observation.find(TAG_STATUS_CODE)
                 if status_element is not None:
                     condition['status'] = status_element.get('code')
 
                 # Extract onset date
-                effective_time = observation.find('.//{{{0}}}effectiveTime'.format(namespaces['cda']))
+                effective_time = observation.find(TAG_EFFECTIVE_TIME)
                 if effective_time is not None:
-                    low_time = effective_time.find('.//{{{0}}}low'.format(namespaces['cda']))
+                    low_time = effective_time.find(TAG_LOW)
                     if low_time is not None:
-                        condition['onsetDate'] = low_time.get('value', '')
-                        if condition['onsetDate'] and len(condition['onsetDate']) >= 8:
-                            year = condition['onsetDate'][:4]
-                            month = condition['onsetDate'][4:6]
-                            day = condition['onsetDate'][6:8]
-                            condition['onsetDate'] = f"{year}-{month}-{day}"
+                        condition['onsetDate'] = _fmt_date(low_time.get('value', ''))
 
                 if 'name' in condition and condition['name']:
                     conditions.append(condition)
@@ -227,57 +474,54 @@ def extract_conditions(root):
 
 def extract_medications(root):
     """Extract patient medications from C-CDA"""
+    # Find the medications section (code 10160-0)
+    return extract_medications_from_section(find_section_by_code(root, "10160-0"))
+
+def extract_medications_from_section(med_section):
+    """Extract patient medications from the C-CDA medications section"""
     medications = []
 
     try:
-        # Find the medications section (code 10160-0)
-        med_section = find_section_by_code(root, "10160-0")
-
         if med_section is not None:
             # Get all entries in the medications section
-            entries = med_section.findall('.//{{{0}}}entry'.format(namespaces['cda']))
+            entries = med_section.findall(TAG_ENTRY)
 
             for entry in entries:
                 medication = {}
 
                 # Get substance administration
-                substance_admin = entry.find('.//{{{0}}}substanceAdministration'.format(namespaces['cda']))
+                substance_admin = entry.find(TAG_SUBSTANCE_ADMINISTRATION)
                 if substance_admin is None:
                     continue
 
                 # Extract medication details
-                product = substance_admin.find('.//{{{0}}}manufacturedProduct'.format(namespaces['cda']))
+                product = substance_admin.find(PATH_MANUFACTURED_PRODUCT)
                 if product is not None:
-                    material = product.find('.//{{{0}}}manufacturedMaterial'.format(namespaces['cda']))
+                    material = product.find(TAG_MANUFACTURED_MATERIAL)
                     if material is not None:
-                        code_element = material.find('.//{{{0}}}code'.format(namespaces['cda']))
+                        code_element = material.find(TAG_CODE)
                         if code_element is not None:
                             medication['code'] = code_element.get('code')
                             medication['name'] = code_element.get('displayName', '')
 
                             # If no display name in the code, try to find it in the translation
                             if not medication['name']:
-                                translation = code_element.find('.//{{{0}}}translation'.format(namespaces['cda']))
+                                translation = code_element.find(TAG_TRANSLATION)
                                 if translation is not None:
                                     medication['name'] = translation.get('displayName', '')
 
                 # Extract dosage
-                doseQuantity = substance_admin.find('.//{{{0}}}doseQuantity'.format(namespaces['cda']))
+                doseQuantity = substance_admin.find(TAG_DOSE_QUANTITY)
                 if doseQuantity is not None:
                     medication['dose'] = doseQuantity.get('value', '')
                     medication['unit'] = doseQuantity.get('unit', '')
 
                 # Extract dates
-                effective_time = substance_admin.find('.//{{{0}}}effectiveTime'.format(namespaces['cda']))
+                effective_time = substance_admin.find(TAG_EFFECTIVE_TIME)
                 if effective_time is not None:
-                    low_time = effective_time.find('.//{{{0}}}low'.format(namespaces['cda']))
+                    low_time = effective_time.find(TAG_LOW)
                     if low_time is not None:
-                        medication['startDate'] = low_time.get('value', '')
-                        if medication['startDate'] and len(medication['startDate']) >= 8:
-                            year = medication['startDate'][:4]
-                            month = medication['startDate'][4:6]
-                            day = medication['startDate'][6:8]
-                            medication['startDate'] = f"{year}-{month}-{day}"
+                        medication['startDate'] = _fmt_date(low_time.get('value', ''))
 
                 if 'name' in medication and medication['name']:
                     medications.append(medication)
@@ -289,65 +533,47 @@ def extract_medications(root):
 
 def extract_lab_results(root):
     """Extract patient lab results from C-CDA"""
+    # Find the results section (code 30954-2)
+    return extract_lab_results_from_section(find_section_by_code(root, "30954-2"))
+
+def extract_lab_results_from_section(results_section):
+    """Extract patient lab results from the C-CDA results section"""
     labs = []
 
     try:
-        # Find the results section (code 30954-2)
-        results_section = find_section_by_code(root, "30954-2")
-
         if results_section is not None:
-            # Get all entries in the results section
-            entries = results_section.findall('.//{{{0}}}entry'.format(namespaces['cda']))
-
-            for entry in entries:
-                # Get organizer (panel)
-                organizer = entry.find('.//{{{0}}}organizer'.format(namespaces['cda']))
-                if organizer is None:
-                    continue
-
-                # Get individual results within the panel
-                components = organizer.findall('.//{{{0}}}component'.format(namespaces['cda']))
+            # Walk every panel's observations in one pass
+            for observation in results_section.iterfind(PATH_PANEL_OBSERVATION):
+                lab = {}
 
-                for component in components:
-                    observation = component.find('.//{{{0}}}observation'.format(namespaces['cda']))
-                    if observation is None:
-                        continue
+                # Extract test code
+                code_element = observation.find(TAG_CODE)
+                if code_element is not None:
+                    lab['code'] = code_element.get('code')
+                    lab['name'] = code_element.get('displayName', '')
 
-                    lab = {}
+                # Extract result
+                value_element = observation.find(TAG_VALUE)
+                if value_element is not None:
+                    lab['value'] = value_element.get('value', '')
+                    lab['unit'] = value_element.get('unit', '')
+
+                # Extract reference range
+                reference_range = observation.find(TAG_REFERENCE_RANGE)
+                if reference_range is not None:
+                    obs_range = reference_range.find(TAG_OBSERVATION_RANGE)
+                    if obs_range is not None:
+                        text = obs_range.find(TAG_TEXT)
+                        if text is not None and text.text:
+                            lab['referenceRange'] = text.text
 
-                    # Extract test code
-                    code_element = observation.find('.//{{{0}}}code'.format(namespaces['cda']))
-                    if code_element is not None:
-                        lab['code'] = code_element.get('code')
-                        lab['name'] = code_element.get('displayName', '')
+                # Extract date
+                effective_time = observation.find(TAG_EFFECTIVE_TIME)
+                if effective_time is not None:
+                    lab['date'] = _fmt_date(effective_time.get('value', ''))
 
-                    # Extract result
-                    value_element = observation.find('.//{{{0}}}value'.format(namespaces['cda']))
-                    if value_element is not None:
-                        lab['value'] = value_element.get('value', '')
-                        lab['unit'] = value_element.get('unit', '')
-
-                    # Extract reference range
-                    reference_range = observation.find('.//{{{0}}}referenceRange'.format(namespaces['cda']))
-                    if reference_range is not None:
-                        obs_range = reference_range.find('.//{{{0}}}observationRange'.format(namespaces['cda']))
-                        if obs_range is not None:
-                            text = obs_range.find('.//{{{0}}}text'.format(namespaces['cda']))
-                            if text is not None and text.text:
-                                lab['referenceRange'] = text.text
-
-                    # Extract date
-                    effective_time = observation.find('.//{{{0}}}effectiveTime'.format(namespaces['cda']))
-                    if effective_time is not None:
-                        lab['date'] = effective_time.get('value', '')
-                        if lab['date'] and len(lab['date']) >= 8:
-                            year = lab['date'][:4]
-                            month = lab['date'][4:6]
-                            day = lab['date'][6:8]
-                            lab['date'] = f"{year}-{month}-{day}"
-
-                    if 'name' in lab and lab['name'] and 'value' in lab:
-                        labs.append(lab)
+                if 'name' in lab and lab['name'] and 'value' in lab:
+                    labs.append(lab)
 
     except Exception as e:
         print(f"Error extracting lab results: {str(e)}")
@@ -356,39 +582,36 @@ def extract_lab_results(root):
 
 def extract_procedures(root):
     """Extract patient procedures from C-CDA"""
+    # Find the procedures section (code 47519-4)
+    return extract_procedures_from_section(find_section_by_code(root, "47519-4"))
+
+def extract_procedures_from_section(procedures_section):
+    """Extract patient procedures from the C-CDA procedures section"""
     procedures = []
 
     try:
-        # Find the procedures section (code 47519-4)
-        procedures_section = find_section_by_code(root, "47519-4")
-
         if procedures_section is not None:
             # Get all entries in the procedures section
-            entries = procedures_section.findall('.//{{{0}}}entry'.format(namespaces['cda']))
+            entries = procedures_section.findall(TAG_ENTRY)
 
             for entry in entries:
                 procedure = {}
 
                 # Get procedure information
-                procedure_element = entry.find('.//{{{0}}}procedure'.format(namespaces['cda']))
+                procedure_element = entry.find(TAG_PROCEDURE)
                 if procedure_element is None:
                     continue
 
                 # Extract procedure code
-                code_element = procedure_element.find('.//{{{0}}}code'.format(namespaces['cda']))
+                code_element = procedure_element.find(TAG_CODE)
                 if code_element is not None:
                     procedure['code'] = code_element.get('code')
                     procedure['name'] = code_element.get('displayName', '')
 
                 # Extract date
-                effective_time = procedure_element.find('.//{{{0}}}effectiveTime'.format(namespaces['cda']))
+                effective_time = procedure_element.find(TAG_EFFECTIVE_TIME)
                 if effective_time is not None:
-                    procedure['date'] = effective_time.get('value', '')
-                    if procedure['date'] and len(procedure['date']) >= 8:
-                        year = procedure['date'][:4]
-                        month = procedure['date'][4:6]
-                        day = procedure['date'][6:8]
-                        procedure['date'] = f"{year}-{month}-{day}"
+                    procedure['date'] = _fmt_date(effective_time.get('value', ''))
 
                 if 'name' in procedure and procedure['name']:
                     procedures.append(procedure)
@@ -400,51 +623,35 @@ def extract_procedures(root):
 
 def extract_vitals(root):
     """Extract patient vital signs from C-CDA"""
+    # Find the vitals section (code 8716-3)
+    return extract_vitals_from_section(find_section_by_code(root, "8716-3"))
+
+def extract_vitals_from_section(vitals_section):
+    """Extract patient vital signs from the C-CDA vital signs section"""
     vitals = []
 
     try:
-        # Find the vitals section (code 8716-3)
-        vitals_section = find_section_by_code(root, "8716-3")
-
         if vitals_section is not None:
-            # Get all entries in the vitals section
-            entries = vitals_section.findall('.//{{{0}}}entry'.format(namespaces['cda']))
-
-            for entry in entries:
-                # Get organizer (vital signs panel)
-                organizer = entry.find('.//{{{0}}}organizer'.format(namespaces['cda']))
-                if organizer is None:
-                    continue
-
+            # Each vital signs panel carries the date shared by its observations
+            for organizer in vitals_section.iterfind(PATH_ENTRY_ORGANIZER):
                 # Extract date for this set of vitals
-                effective_time = organizer.find('.//{{{0}}}effectiveTime'.format(namespaces['cda']))
+                effective_time = organizer.find(TAG_EFFECTIVE_TIME)
                 measurement_date = None
                 if effective_time is not None:
-                    measurement_date = effective_time.get('value', '')
-                    if measurement_date and len(measurement_date) >= 8:
-                        year = measurement_date[:4]
-                        month = measurement_date[4:6]
-                        day = measurement_date[6:8]
-                        measurement_date = f"{year}-{month}-{day}"
+                    measurement_date = _fmt_date(effective_time.get('value', ''))
 
                 # Get individual vital signs within the panel
-                components = organizer.findall('.//{{{0}}}component'.format(namespaces['cda']))
-
-                for component in components:
-                    observation = component.find('.//{{{0}}}observation'.format(namespaces['cda']))
-                    if observation is None:
-                        continue
-
+                for observation in organizer.iterfind(PATH_COMPONENT_OBSERVATION):
                     vital = {}
 
                     # Extract vital type
-                    code_element = observation.find('.//{{{0}}}code'.format(namespaces['cda']))
+                    code_element = observation.find(TAG_CODE)
                     if code_element is not None:
                         vital['code'] = code_element.get('code')
                         vital['name'] = code_element.get('displayName', '')
 
                     # Extract value
-                    value_element = observation.find('.//{{{0}}}value'.format(namespaces['cda']))
+                    value_element = observation.find(TAG_VALUE)
                     if value_element is not None:
                         vital['value'] = value_element.get('value', '')
                         vital['unit'] = value_element.get('unit', '')
@@ -466,87 +673,107 @@ def extract_clinical_notes(root):
     notes = []
 
     try:
-        # Common clinical note section codes
-        note_section_codes = [
-            "11488-4",  # Consultation Note
-            "18842-5",  # Discharge Summary
-            "28570-0",  # Procedure Note
-            "34117-2",  # History and Physical Note
-            "34839-1",  # Progress Note
-            "51845-6",  # Assessment and Plan
-            "51847-2",  # Evaluation Note
-            "47039-3",  # Hospital Admission Diagnosis
-            "8648-8",   # Hospital Course
-            "10184-0"   # Surgical Operation Note
-        ]
-
-        # Find all matching sections
-        for section_code in note_section_codes:
-            section = find_section_by_code(root, section_code)
-            if section is not None:
-                # Get section title
-                title_element = section.find('.//{{{0}}}title'.format(namespaces['cda']))
-                section_title = title_element.text if title_element is not None and title_element.text else f"Note Section {section_code}"
-
-                # Get text content
-                text_element = section.find('.//{{{0}}}text'.format(namespaces['cda']))
-                if text_element is not None:
-                    # Extract pure text and remove XML formatting
-                    text_content = get_text_from_element(text_element)
-
-                    if text_content:
-                        # Get date for this note if available
-                        effective_time = section.find('.//{{{0}}}effectiveTime'.format(namespaces['cda']))
-                        note_date = None
-                        if effective_time is not None:
-                            low_element = effective_time.find('.//{{{0}}}low'.format(namespaces['cda']))
-                            if low_element is not None:
-                                note_date = low_element.get('value', '')
-                            else:
-                                note_date = effective_time.get('value', '')
-
-                            if note_date and len(note_date) >= 8:
-                                year = note_date[:4]
-                                month = note_date[4:6]
-                                day = note_date[6:8]
-                                note_date = f"{year}-{month}-{day}"
-
-                        note = {
-                            "type": section_title,
-                            "code": section_code,
-                            "date": note_date,
-                            "content": text_content
-                        }
-                        notes.append(note)
+        # Index the body once rather than searching it for each note section code
+        sections_by_code = build_section_index(root)
+        for section_code in NOTE_SECTION_CODES:
+            note = extract_note_from_section(sections_by_code.get(section_code), section_code)
+            if note is not None:
+                notes.append(note)
 
         # If we didn't find specific note sections, look for general clinical documents
         if not notes:
             # Check for document-level narrative
-            component = root.find('.//{{{0}}}component'.format(namespaces['cda']))
+            component = root.find(TAG_COMPONENT)
             if component is not None:
-                structured_body = component.find('.//{{{0}}}structuredBody'.format(namespaces['cda']))
+                structured_body = component.find(TAG_STRUCTURED_BODY)
                 if structured_body is not None:
-                    for comp in structured_body.findall('.//{{{0}}}component'.format(namespaces['cda'])):
-                        section = comp.find('.//{{{0}}}section'.format(namespaces['cda']))
-                        if section is not None:
-                            title_element = section.find('.//{{{0}}}title'.format(namespaces['cda']))
-                            if title_element is not None and title_element.text:
-                                section_title = title_element.text
-                                text_element = section.find('.//{{{0}}}text'.format(namespaces['cda']))
-                                if text_element is not None:
-                                    text_content = get_text_from_element(text_element)
-                                    if text_content:
-                                        note = {
-                                            "type": section_title,
-                                            "content": text_content
-                                        }
-                                        notes.append(note)
+                    for comp in structured_body.findall(PATH_ANY_COMPONENT):
+                        note = extract_narrative_from_section(comp.find(TAG_SECTION))
+                        if note is not None:
+                            notes.append(note)
 
     except Exception as e:
         print(f"Error extracting clinical notes: {str(e)}")
 
     return notes
 
+def extract_note_from_section(section, section_code):
+    """Build a clinical note from a C-CDA note section, or None if it has no text"""
+    if section is None:
+        return None
+
+    # Get section title
+    title_element = section.find(TAG_TITLE)
+    section_title = title_element.text if title_element is not None and title_element.text else f"Note Section {section_code}"
+
+    # Get text content
+    text_element = section.find(TAG_TEXT)
+    if text_element is None:
+        return None
+
+    # Extract pure text and remove XML formatting
+    text_content = get_text_from_element(text_element)
+    if not text_content:
+        return None
+
+    # Get date for this note if available
+    effective_time = section.find(PATH_ANY_EFFECTIVE_TIME)
+    note_date = None
+    if effective_time is not None:
+        low_element = effective_time.find(TAG_LOW)
+        if low_element is not None:
+            note_date = _fmt_date(low_element.get('value', ''))
+        else:
+            note_date = _fmt_date(effective_time.get('value', ''))
+
+    return {
+        "type": section_title,
+        "code": section_code,
+        "date": note_date,
+        "content": text_content
+    }
+
+def extract_narrative_from_section(section):
+    """Build an untyped note from any titled C-CDA section with narrative text, or None"""
+    if section is None:
+        return None
+
+    title_element = section.find(TAG_TITLE)
+    if title_element is None or not title_element.text:
+        return None
+
+    text_element = section.find(TAG_TEXT)
+    if text_element is None:
+        return None
+
+    text_content = get_text_from_element(text_element)
+    if not text_content:
+        return None
+
+    return {
+        "type": title_element.text,
+        "content": text_content
+    }
+
+# Body sections parsed into patient data by parse_ccda_file: code -> (key, extractor)
+_SECTION_EXTRACTORS = {
+    "11450-4": ("conditions", extract_conditions_from_section),
+    "10160-0": ("medications", extract_medications_from_section),
+    "30954-2": ("labs", extract_lab_results_from_section),
+    "47519-4": ("procedures", extract_procedures_from_section),
+    "8716-3": ("vitals", extract_vitals_from_section)
+}
+
+def _append_block_text(block, prefix, parts):
+    """Append a paragraph or list item's own text and its children's text to parts"""
+    if block.text:
+        parts += (prefix + block.text.strip(), "\n")
+    for child in block:
+        if child.text:
+            parts += (child.text.strip(), " ")
+        if child.tail:
+            parts += (child.tail.strip(), " ")
+
 def get_text_from_element(element):
     """
     Extract clean text from an XML element, stripping tags but preserving structure.
@@ -559,69 +786,107 @@ def get_text_from_element(element):
     if element is None:
         return ""
 
-    # First try to get element text directly
-    result = ""
-    if element.text:
-        result += element.text.strip() + " "
-
-    # Process paragraph elements
-    for paragraph in element.findall('.//{{{0}}}paragraph'.format(namespaces['cda'])):
-        if paragraph.text:
-            result += paragraph.text.strip() + "\n"
-        # Get text from all children
-        for child in paragraph:
-            if child.text:
-                result += child.text.strip() + " "
-            if child.tail:
-                result += child.tail.strip() + " "
-
-    # Process list items
-    for item in element.findall('.//{{{0}}}item'.format(namespaces['cda'])):
-        if item.text:
-            result += "- " + item.text.strip() + "\n"
-        # Get text from all children
-        for child in item:
-            if child.text:
-                result += child.text.strip() + " "
-            if child.tail:
-                result += child.tail.strip() + " "
-
-    # Process content referenced by IDs
-    for content in element.findall('.//{{{0}}}content'.format(namespaces['cda'])):
-        if content.text:
-            result += content.text.strip() + " "
+    # Flatten the narrative in one walk over its descendants, collecting paragraph,
+    # list item and referenced content text separately so they keep their order
+    parts = [element.text.strip(), " "] if element.text else []
+    paragraphs = []
+    items = []
+    contents = []
+    for child in element:
+        for node in child.iter():
+            tag = node.tag
+            if tag == TAG_PARAGRAPH:
+                _append_block_text(node, "", paragraphs)
+            elif tag == TAG_ITEM:
+                _append_block_text(node, "- ", items)
+            elif tag == TAG_CONTENT and node.text:
+                contents += (node.text.strip(), " ")
+
+    result = "".join(parts + paragraphs + items + contents)
 
     # Clean up the text - replace multiple spaces with single space
-    result = re.sub(r'\s+', ' ', result)
+    result = _WS_RE.sub(' ', result)
     # Remove XML tags that might have been included as text
-    result = re.sub(r'<[^>]+>', '', result)
+    result = _TAG_RE.sub('', result)
 
     return result.strip()
 
-def process_ccda_directory(directory_path, output_json_path):
+def dumps_json(data):
     """
-    Process all C-CDA files in a directory and save the extracted data to a JSON file.
+    Serialize data to indented JSON bytes, using orjson when it is installed.
 
     Args:
-        directory_path: Path to directory containing C-CDA files
-        output_json_path: Path to save output JSON file
+        data: JSON-serializable data
+
+    Returns:
+        bytes: UTF-8 encoded JSON
     """
-    patient_data_list = []
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
 
-    # Get all XML files in the directory
-    xml_files = [f for f in os.listdir(directory_path) if f.endswith('.xml')]
+def write_json(output_path, data):
+    """
+    Serialize data to indented JSON, using orjson when it is installed, and write it
+    to the file in a single call.
 
-    for xml_file in xml_files:
-        file_path = os.path.join(directory_path, xml_file)
-        print(f"Processing {file_path}")
+    Args:
+        output_path: Path of the JSON file to write
+        data: JSON-serializable data
+    """
+    payload = dumps_json(data)
+
+    with open(output_path, 'wb') as json_file:
+        json_file.write(payload)
 
-        patient_data = parse_ccda_file(file_path)
-        if patient_data:
-            patient_data_list.append(patient_data)
+def process_ccda_directory(directory_path, output_json_path, max_workers=None):
+    """
+    Process all C-CDA files in a directory and save the extracted data to a JSON file.
 
-    # Save the extracted data to JSON
-    with open(output_json_path, 'w') as json_file:
-        json.dump(patient_data_list, json_file, indent=2)
+    Args:
+        directory_path: Path to directory containing C-CDA files
+        output_json_path: Path to save output JSON file
+        max_workers: Number of worker processes parsing files in parallel
+            (defaults to the CPU count; 1 parses the files sequentially)
+    """
+    # Get all XML files in the directory; scandir entries carry their joined path and
+    # file type, so no separate stat or path join is needed per file
+    with os.scandir(directory_path) as entries:
+        file_paths = [entry.path for entry in entries if entry.name.endswith('.xml') and entry.is_file()]
+
+    # Age every patient in this directory against the same date
+    parse_file = partial(parse_ccda_file, reference_date=_reference_date())
+
+    # Each file parses independently, so spread them across processes; map keeps the
+    # results in file order
+    if max_workers == 1 or len(file_paths) <= 1:
+        parsed = map(parse_file, file_paths)
+        executor = None
+    else:
+        max_workers = max_workers or os.cpu_count()
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        # Batch files per task to cut inter-process overhead, while leaving several
+        # batches per worker so the load stays balanced
+        chunksize = max(1, len(file_paths) // (max_workers * 4))
+        parsed = executor.map(parse_file, file_paths, chunksize=chunksize)
+
+    # Stream each patient into the JSON array as its file is parsed, in the same indented
+    # layout as dumping the whole list; JSON strings hold no raw newlines, so indenting
+    # every line of a serialized patient nests it one level inside the array
+    patient_data_list = []
+    try:
+        with open(output_json_path, 'wb') as json_file:
+            json_file.write(b"[")
+            for file_path, patient_data in zip(file_paths, parsed):
+                print(f"Processed {file_path}")
+                if patient_data:
+                    json_file.write(b",\n  " if patient_data_list else b"\n  ")
+                    json_file.write(dumps_json(patient_data).replace(b"\n", b"\n  "))
+                    patient_data_list.append(patient_data)
+            json_file.write(b"\n]" if patient_data_list else b"]")
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     print(f"Processed {len(patient_data_list)} C-CDA files. Data saved to {output_json_path}")
     return patient_data_list
@@ -636,26 +901,43 @@ def create_patient_summary(patient_data_list):
     Returns:
         pandas DataFrame with patient summaries
     """
-    summaries = []
+    if not patient_data_list:
+        return pd.DataFrame()
+
+    # Fill the columns directly so pandas infers each column's dtype once
+    columns = {
+        "patientId": [],
+        "age": [],
+        "gender": [],
+        "race": [],
+        "ethnicity": [],
+        "conditions_count": [],
+        "medications_count": [],
+        "labs_count": [],
+        "procedures_count": [],
+        "notes_count": [],
+        "conditions": [],
+        "medications": []
+    }
 
     for patient in patient_data_list:
-        summary = {
-            "patientId": patient["patientId"],
-            "age": patient["demographics"].get("age", "Unknown"),
-            "gender": patient["demographics"].get("gender", "Unknown"),
-            "race": patient["demographics"].get("race", "Unknown"),
-            "ethnicity": patient["demographics"].get("ethnicity", "Unknown"),
-            "conditions_count": len(patient["conditions"]),
-            "medications_count": len(patient["medications"]),
-            "labs_count": len(patient["labs"]),
-            "procedures_count": len(patient["procedures"]),
-            "notes_count": len(patient["clinicalNotes"]),
-            "conditions": ", ".join([c["name"] for c in patient["conditions"] if "name" in c and c["name"]]),
-            "medications": ", ".join([m["name"] for m in patient["medications"] if "name" in m and m["name"]])
-        }
-        summaries.append(summary)
-
-    return pd.DataFrame(summaries)
+        demographics = patient["demographics"]
+        conditions = patient["conditions"]
+        medications = patient["medications"]
+        columns["patientId"].append(patient["patientId"])
+        columns["age"].append(demographics.get("age", "Unknown"))
+        columns["gender"].append(demographics.get("gender", "Unknown"))
+        columns["race"].append(demographics.get("race", "Unknown"))
+        columns["ethnicity"].append(demographics.get("ethnicity", "Unknown"))
+        columns["conditions_count"].append(len(conditions))
+        columns["medications_count"].append(len(medications))
+        columns["labs_count"].append(len(patient["labs"]))
+        columns["procedures_count"].append(len(patient["procedures"]))
+        columns["notes_count"].append(len(patient["clinicalNotes"]))
+        columns["conditions"].append(", ".join([c["name"] for c in conditions if c.get("name")]))
+        columns["medications"].append(", ".join([m["name"] for m in medications if m.get("name")]))
+
+    return pd.DataFrame(columns)
 
 def generate_semantic_search_query(patient_data):
     """
@@ -692,14 +974,14 @@ def generate_semantic_search_query(patient_data):
     # Add primary conditions (up to 3 most recent)
     conditions = patient_data.get("conditions", [])
     if conditions:
-        # Sort by onset date if available, most recent first
-        sorted_conditions = sorted(
-            [c for c in conditions if "name" in c and c["name"]],
-            key=lambda x: x.get("onsetDate", ""),
-            reverse=True
+        # Take the three most recent by onset date if available, without sorting them all
+        recent_conditions = heapq.nlargest(
+            3,
+            (c for c in conditions if c.get("name")),
+            key=lambda x: x.get("onsetDate", "")
         )
 
-        condition_names = [c["name"] for c in sorted_conditions[:3]]
+        condition_names = [c["name"] for c in recent_conditions]
         if condition_names:
             if len(condition_names) == 1:
                 query_parts.append(f"diagnosed with {condition_names[0]}")
@@ -749,14 +1031,14 @@ def generate_semantic_search_query(patient_data):
     # Add recent procedures (up to 2 most recent)
     procedures = patient_data.get("procedures", [])
     if procedures:
-        # Sort by date if available, most recent first
-        sorted_procedures = sorted(
-            [p for p in procedures if "name" in p and p["name"]],
-            key=lambda x: x.get("date", ""),
-            reverse=True
+        # Take the two most recent by date if available, without sorting them all
+        recent_procedures = heapq.nlargest(
+            2,
+            (p for p in procedures if p.get("name")),
+            key=lambda x: x.get("date", "")
         )
 
-        procedure_names = [p["name"] for p in sorted_procedures[:2]]
+        procedure_names = [p["name"] for p in recent_procedures]
         if procedure_names:
             if len(procedure_names) == 1:
                 query_parts.append(f"underwent {procedure_names[0]}")
@@ -774,7 +1056,7 @@ def generate_semantic_search_query(patient_data):
 
     if assessment_notes:
         # Get the most recent assessment note
-        latest_note = sorted(assessment_notes, key=lambda x: x.get("date", ""), reverse=True)[0]
+        latest_note = max(assessment_notes, key=lambda x: x.get("date", ""))
         note_content = latest_note.get("content", "")
 
         # Extract key phrases (simplified approach)
@@ -999,17 +1281,13 @@ def save_patient_data_with_summary(patient_data_list, output_json_path):
         enhanced_patient_data.append(enhanced_data)
 
     # Save the enhanced data to JSON
-    with open(output_json_path, 'w') as json_file:
-        json.dump(enhanced_patient_data, json_file, indent=2)
+    write_json(output_json_path, enhanced_patient_data)
 
     print(f"Enhanced patient data with clinical summaries and semantic search queries saved to {output_json_path}")
     return enhanced_patient_data
 
 # Example usage
 if __name__ == "__main__":
-    # Register namespaces
-    register_namespaces()
-
     # Path to directory containing C-CDA files
     ccda_directory = "../data/synthea_sample_data_ccda_latest"
 
@@ -85,6 +85,7 @@ class TestCreateVectorDB(unittest.TestCase):
         # Mock ChromaDB Collection
         mock_collection = MagicMock()
         mock_collection.count.return_value = 1
+        mock_collection.get.return_value = {"ids": ["NCT12345"], "embeddings": [[0.1, 0.2, 0.3]]}
 
         # Mock ChromaDB Client
         mock_client_instance = MagicMock()
@@ -101,4 +102,8 @@ class TestCreateVectorDB(unittest.TestCase):
         # Check that the collection was created and documents were added
         mock_client.assert_called_once_with(path=self.test_chroma_path)
         mock_client_instance.get_or_create_collection.assert_called_once()
-        mock_collection.add.assert_called_once()
\ No newline at end of file
+        mock_collection.add.assert_called_once()
+
+        # Check that the embedding matrix was saved next to the index
+        self.assertTrue(os.path.exists(os.path.join(self.test_chroma_path, "trial_embeddings.npy")))
+        self.assertTrue(os.path.exists(os.path.join(self.test_chroma_path, "trial_ids.npy")))
\ No newline at end of file
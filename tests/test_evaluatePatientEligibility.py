@@ -12,7 +12,8 @@ from src.evaluatePatientEligibility import (
     evaluate_patient_eligibility,
     extract_inclusion_criteria,
     format_inclusion_criteria,
-    save_eligibility_results
+    save_eligibility_results,
+    TOKENS_PER_CRITERION
 )
 
 class TestEvaluatePatientEligibility(unittest.TestCase):
@@ -233,4 +234,28 @@ class TestEvaluatePatientEligibility(unittest.TestCase):
         self.assertEqual(result["trials_evaluated"], 1)
         self.assertEqual(len(result["results"]), 1)
         self.assertIn("error", result["results"][0])
-        self.assertEqual(result["results"][0]["error"], "API Error")
\ No newline at end of file
+        self.assertEqual(result["results"][0]["error"], "API Error")
+
+    @patch('src.evaluatePatientEligibility.extract_inclusion_criteria')
+    @patch('src.evaluatePatientEligibility.ChatOpenAI')
+    def test_evaluate_patient_eligibility_scales_max_tokens(self, mock_chat_openai, mock_criteria):
+        """Test that the output token cap grows with the number of criteria"""
+        mock_criteria.return_value = [f"Criterion {i}" for i in range(10)]
+
+        mock_response = MagicMock()
+        mock_response.content = "[]"
+        mock_instance = MagicMock()
+        mock_instance.invoke.return_value = mock_response
+        mock_chat_openai.return_value = mock_instance
+
+        evaluate_patient_eligibility(
+            patient_data=self.patient_data,
+            trials_json_path=self.trials_json,
+            model_name="test-model",
+            top_k=1,
+            max_tokens=800
+        )
+
+        # Ten criteria need more than the 800-token floor
+        _, kwargs = mock_instance.invoke.call_args
+        self.assertEqual(kwargs["max_tokens"], 10 * TOKENS_PER_CRITERION)
@@ -14,11 +14,16 @@ from src.generateOutput import (
     load_eligibility_results,
     format_simple_results,
     format_results_for_output,
+    format_both,
+    _format_results,
     save_json_output,
     create_dataframes,
     create_simple_dataframe,
+    save_excel_output,
     process_single_eligibility_file,
-    generate_output
+    create_summary_spreadsheet,
+    generate_output,
+    write_json
 )
 
 class TestGenerateOutput(unittest.TestCase):
@@ -142,6 +147,27 @@ class TestGenerateOutput(unittest.TestCase):
         self.assertEqual(len(ineligible_trial["criteria_summary"]), 2)
         self.assertFalse(all(c["is_met"] for c in ineligible_trial["criteria_summary"]))
 
+    def test_format_both(self):
+        """Test that the single-pass formatter matches the individual formatters"""
+        formatted_results, simple_results = format_both(self.sample_results)
+
+        self.assertEqual(formatted_results, format_results_for_output(self.sample_results))
+        self.assertEqual(simple_results, format_simple_results(self.sample_results))
+        self.assertEqual(simple_results["eligibleTrials"][0]["trialId"],
+                         formatted_results["eligible_trials"][0]["trial_id"])
+
+    def test_write_json_concurrent_writers(self):
+        """Test that concurrent writes of the same file never collide on a temp file"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        output_file = os.path.join(self.output_dir, "patient_unknown_eligibility.json")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: write_json(output_file, {"writer": i}), range(32)))
+
+        with open(output_file) as f:
+            self.assertIn(json.load(f)["writer"], range(32))
+        self.assertEqual([name for name in os.listdir(self.output_dir) if name.endswith(".tmp")], [])
+
     def test_save_json_output(self):
         """Test saving formatted results to JSON file"""
         formatted_results = format_results_for_output(self.sample_results)
@@ -157,6 +183,52 @@ class TestGenerateOutput(unittest.TestCase):
             self.assertEqual(saved_results["patient_id"], "TEST-123")
             self.assertEqual(len(saved_results["eligible_trials"]), 1)
 
+    def test_create_dataframes_empty_categories(self):
+        """Test that categories without trials produce no DataFrame"""
+        results = dict(self.sample_results, results=self.sample_results["results"][:1])
+        summary_df, eligible_df, ineligible_df, criteria_df = create_dataframes(format_results_for_output(results))
+
+        self.assertEqual(summary_df.iloc[0]["Ineligible Trials"], 0)
+        self.assertEqual(eligible_df.shape[0], 1)
+        self.assertIsNone(ineligible_df)
+
+        # The Excel file is still written, without an Ineligible Trials sheet
+        excel_path = save_excel_output((summary_df, eligible_df, ineligible_df, criteria_df), self.output_dir, "TEST-123")
+        self.assertNotIn("Ineligible Trials", pd.read_excel(excel_path, sheet_name=None))
+
+    def test_save_excel_output(self):
+        """Test that every sheet written to the Excel file round-trips intact"""
+        formatted_results = format_results_for_output(self.sample_results)
+        dataframes = create_dataframes(formatted_results)
+        excel_path = save_excel_output(dataframes, self.output_dir, "TEST-123")
+
+        # Verify the file was created
+        self.assertIsNotNone(excel_path)
+        self.assertTrue(os.path.exists(excel_path))
+
+        # Every row and cell should survive the row-by-row write
+        sheets = pd.read_excel(excel_path, sheet_name=None)
+        self.assertEqual(list(sheets), ["Summary", "Eligible Trials", "Ineligible Trials", "Eligibility Details"])
+        for df, sheet in zip(dataframes, sheets.values()):
+            self.assertEqual(sheet.shape, df.shape)
+            self.assertEqual(list(sheet.columns), list(df.columns))
+        self.assertEqual(sheets["Eligible Trials"].iloc[0]["Trial ID"], "NCT12345")
+        self.assertEqual(list(sheets["Eligibility Details"]["Confidence"]), ["High", "High"])
+
+    def test_save_excel_output_openpyxl_write_only(self):
+        """Test the streamed write through an openpyxl write-only workbook when xlsxwriter is missing"""
+        formatted_results = format_results_for_output(self.sample_results)
+        dataframes = create_dataframes(formatted_results)
+        with patch.dict(sys.modules, {"xlsxwriter": None}):
+            excel_path = save_excel_output(dataframes, self.output_dir, "TEST-123")
+
+        self.assertIsNotNone(excel_path)
+        sheets = pd.read_excel(excel_path, sheet_name=None)
+        self.assertEqual(list(sheets), ["Summary", "Eligible Trials", "Ineligible Trials", "Eligibility Details"])
+        for df, sheet in zip(dataframes, sheets.values()):
+            self.assertEqual(sheet.shape, df.shape)
+        self.assertEqual(sheets["Eligible Trials"].iloc[0]["Trial ID"], "NCT12345")
+
     def test_create_simple_dataframe(self):
         """Test creating a simple DataFrame for Excel output"""
         simple_results = format_simple_results(self.sample_results)
@@ -198,6 +270,39 @@ class TestGenerateOutput(unittest.TestCase):
         # Check the criteria details DataFrame
         self.assertEqual(criteria_df.shape[0], 2)  # Two criteria for the eligible trial
 
+    def test_create_dataframes_confidence_labels(self):
+        """Test that confidence levels are labelled case-insensitively and never dropped"""
+        results = json.loads(json.dumps(self.sample_results))
+        criteria = results["results"][0]["evaluation"]
+        criteria[0]["confidence"] = "High"
+        criteria[1]["confidence"] = "very high"
+
+        criteria_df = create_dataframes(format_results_for_output(results))[3]
+
+        self.assertEqual(list(criteria_df["Confidence"]), ["High", "Very high"])
+        self.assertEqual(list(criteria_df["Confidence"].cat.categories), ["Low", "Medium", "High", "Very high"])
+
+    def test_create_dataframes_with_unmet_criteria(self):
+        """Test that formatting bookkeeping stays out of the JSON and matches a rescan"""
+        formatted_results, _, unmet_criteria = _format_results(self.sample_results)
+
+        # No bookkeeping fields leak into the serialized trial summaries
+        for category in ("eligible_trials", "ineligible_trials"):
+            for trial in formatted_results[category]:
+                self.assertFalse([key for key in trial if key.startswith("_")])
+
+        with_bookkeeping = create_dataframes(formatted_results, unmet_criteria)
+        rescanned = create_dataframes(formatted_results)
+        pd.testing.assert_frame_equal(with_bookkeeping[2], rescanned[2])
+
+    def test_process_single_eligibility_file_date_stamp(self):
+        """Test that an explicit date stamp names every file the patient's processing writes"""
+        result = process_single_eligibility_file(self.eligibility_file, self.output_dir, date_stamp="20240102")
+
+        for key in ("json_path", "simple_json_path", "excel_path"):
+            self.assertTrue(result[key].endswith("_20240102" + os.path.splitext(result[key])[1]))
+            self.assertTrue(os.path.exists(result[key]))
+
     @patch('src.generateOutput.save_excel_output')
     def test_process_single_eligibility_file(self, mock_save_excel):
         """Test processing a single eligibility file"""
@@ -255,12 +360,8 @@ class TestGenerateOutput(unittest.TestCase):
     @patch('src.generateOutput.create_consolidated_json')
     @patch('src.generateOutput.create_comprehensive_excel')
     @patch('src.generateOutput.create_summary_spreadsheet')
-    @patch('glob.glob')
-    def test_generate_output_directory(self, mock_glob, mock_summary, mock_excel, mock_json, mock_process):
+    def test_generate_output_directory(self, mock_summary, mock_excel, mock_json, mock_process):
         """Test generate_output function with a directory of files"""
-        # Configure mocks
-        mock_glob.return_value = [self.eligibility_file, self.eligibility_file + "2"]
-
         test_output = {
             "patient_id": "TEST-123",
             "json_path": "test_path.json",
@@ -279,9 +380,12 @@ class TestGenerateOutput(unittest.TestCase):
         # Create a test directory
         test_dir = os.path.join(self.test_dir, "eligibility_dir")
         os.makedirs(test_dir, exist_ok=True)
+        for file_name in ("patient1.json", "patient2.json", ".hidden.json", "notes.txt"):
+            with open(os.path.join(test_dir, file_name), 'w') as f:
+                json.dump(self.sample_results, f)
 
-        # Test the function
-        result = generate_output(test_dir, self.output_dir)
+        # Test the function (sequentially, since mocks cannot cross process boundaries)
+        result = generate_output(test_dir, self.output_dir, max_workers=1, consolidated=False)
 
         # Verify the result structure for multiple patients
         self.assertIn("individual_outputs", result)
@@ -299,5 +403,59 @@ class TestGenerateOutput(unittest.TestCase):
         mock_json.assert_called_once()
         mock_excel.assert_called_once()
 
+    def test_create_summary_spreadsheet_csv(self):
+        """Test that the summary is written as CSV files when use_csv is set"""
+        formatted_results = format_results_for_output(self.sample_results)
+        output_files = [{"patient_id": "TEST-123", "formatted_results": formatted_results}]
+
+        summary_file = create_summary_spreadsheet(output_files, self.output_dir, date_stamp="20230101", use_csv=True)
+
+        self.assertEqual(summary_file, os.path.join(self.output_dir, "all_patients_summary_20230101.csv"))
+        summary_df = pd.read_csv(summary_file)
+        self.assertEqual(list(summary_df["Eligible Trials"]), [1])
+        eligible_df = pd.read_csv(os.path.join(self.output_dir, "all_patients_eligible_trials_20230101.csv"))
+        self.assertEqual(list(eligible_df["Trial ID"]), ["NCT12345"])
+        self.assertFalse(any(name.endswith(".xlsx") for name in os.listdir(self.output_dir)))
+
+    def test_create_summary_spreadsheet_null_trials_evaluated(self):
+        """Test that a null trials_evaluated count is written as 0 in the summary"""
+        formatted_results = format_results_for_output(dict(self.sample_results, trials_evaluated=None))
+        output_files = [{"patient_id": "TEST-123", "formatted_results": formatted_results}]
+
+        summary_file = create_summary_spreadsheet(output_files, self.output_dir, date_stamp="20230101", use_csv=True)
+
+        summary_df = pd.read_csv(summary_file)
+        self.assertEqual(list(summary_df["Total Trials Evaluated"]), [0])
+
+    def test_generate_output_directory_parallel(self):
+        """Test generate_output processing a directory of files in worker processes"""
+        # Create a directory with two patients' eligibility results
+        test_dir = os.path.join(self.test_dir, "eligibility_dir")
+        os.makedirs(test_dir, exist_ok=True)
+        for patient_id in ("TEST-1", "TEST-2"):
+            patient_results = dict(self.sample_results, patient_id=patient_id)
+            with open(os.path.join(test_dir, f"{patient_id}.json"), 'w') as f:
+                json.dump(patient_results, f)
+
+        result = generate_output(test_dir, self.output_dir, max_workers=2)
+
+        # Both patients should be processed and consolidated
+        self.assertEqual(len(result["individual_outputs"]), 2)
+        self.assertEqual(
+            sorted(output["patient_id"] for output in result["individual_outputs"]),
+            ["TEST-1", "TEST-2"]
+        )
+        self.assertTrue(os.path.exists(result["consolidated_json"]))
+
+        # All patients and the summary go into one workbook by default
+        self.assertEqual(result["summary_spreadsheet"], result["consolidated_excel"])
+        sheets = pd.read_excel(result["consolidated_excel"], sheet_name=None)
+        self.assertEqual(sheets["Patient Summary"].shape[0], 2)
+        for patient_id in ("TEST-1", "TEST-2"):
+            self.assertIn(f"Eligible_{patient_id}", sheets)
+            self.assertIn(f"Ineligible_{patient_id}", sheets)
+        self.assertTrue(all(output["excel_path"] == result["consolidated_excel"]
+                            for output in result["individual_outputs"]))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
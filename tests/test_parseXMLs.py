@@ -8,7 +8,7 @@ from xml.etree import ElementTree as ET
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Import the module to test
-from src.parseXMLs import register_namespaces, extract_demographics, parse_ccda_file, extract_conditions, extract_key_clinical_info
+from src.parseXMLs import register_namespaces, extract_demographics, parse_ccda_file, extract_conditions, extract_key_clinical_info, build_section_index, find_section_by_code
 
 class TestParseXMLs(unittest.TestCase):
     def setUp(self):
@@ -48,4 +48,16 @@ class TestParseXMLs(unittest.TestCase):
         # If the file exists, test parsing it
         patient_data = parse_ccda_file(self.test_file)
         self.assertIsNotNone(patient_data)
-        self.assertIn('demographics', patient_data)
\ No newline at end of file
+        self.assertIn('demographics', patient_data)
+
+    def test_build_section_index(self):
+        if not os.path.exists(self.test_file):
+            self.skipTest(f"Test file not found: {self.test_file}")
+
+        root = ET.parse(self.test_file).getroot()
+        sections_by_code = build_section_index(root)
+
+        # Every indexed section is the one find_section_by_code returns for its code
+        self.assertIn('11450-4', sections_by_code)
+        for code, section in sections_by_code.items():
+            self.assertIs(section, find_section_by_code(root, code))